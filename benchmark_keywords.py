@@ -0,0 +1,83 @@
+import random
+import timeit
+
+from main import KEYWORDS, KEYWORD_TABLES, PersonalityManager, TextAnalyzer
+
+# Compara a varredura única do KeywordMatcher com as buscas `palavra in texto.lower()`
+# que cada analisador fazia separadamente para a mesma mensagem.
+
+MENSAGENS = [
+    "Oi, tudo bem?",
+    "Quero começar a investir, sou iniciante. O que é mais fácil de entender?",
+    "Qual a taxa selic hoje e como isso afeta o rendimento do tesouro e do cdb?",
+    "Explique como funciona a tributação de dividendos de ações e fii, com exemplos",
+    "uai, o trem tá caro demais, mano. Vale a pena comprar dólar agora?",
+    "Tenho 35 anos, sou conservador e penso na aposentadoria no longo prazo. Como planejar?",
+    "Falando em cripto, bitcoin ainda é uma boa ou é melhor mudar para outro assunto?",
+    "Qual a tendência do mercado e a projeção da inflação para o próximo ano?",
+]
+
+
+def legado(texto):
+    """Buscas como eram feitas antes: cada analisador baixa a caixa e testa cada palavra."""
+    resultado = {}
+    for tabela, categorias in KEYWORD_TABLES.items():
+        texto_minusculo = texto.lower()
+        if tabela == "regions":
+            texto_minusculo = f" {texto_minusculo} "
+        for categoria, palavras in categorias.items():
+            encontradas = [p for p in palavras if p in texto_minusculo]
+            if encontradas:
+                resultado[(tabela, categoria)] = set(encontradas)
+    return resultado
+
+
+def novo(texto):
+    """Mesma análise com o KeywordMatcher (uma varredura por mensagem)."""
+    KEYWORDS.scan.cache_clear()  # Mede a varredura, não o cache entre iterações
+    hits = KEYWORDS.scan(texto)
+    return {
+        (tabela, categoria): set(hits.get(tabela, categoria))
+        for tabela, categorias in KEYWORD_TABLES.items()
+        for categoria in hits.categories(tabela)
+    }
+
+
+def analisadores(texto, personality_manager, text_analyzer):
+    """Chamadas feitas para cada mensagem recebida."""
+    personality_manager.select_appropriate_personality(texto)
+    text_analyzer.extract_topics(texto)
+    text_analyzer.detect_question_complexity(texto)
+    text_analyzer.detect_user_region(texto)
+    KEYWORDS.scan(texto).any("search", "message")
+    KEYWORDS.scan(texto).any("question", "reflection")
+
+
+if __name__ == "__main__":
+    palavras = sorted({p.strip() for categorias in KEYWORD_TABLES.values() for ps in categorias.values() for p in ps})
+    palavras += "o a de que para com um uma quero saber sobre meu dinheiro agora".split()
+    random.seed(42)
+    aleatorias = [" ".join(random.choice(palavras) for _ in range(random.randint(1, 40))) for _ in range(1000)]
+
+    for texto in MENSAGENS + aleatorias:
+        assert legado(texto) == novo(texto), texto
+    print(f"Resultados idênticos em {len(MENSAGENS) + len(aleatorias)} mensagens")
+
+    repeticoes = 2000
+    t_legado = timeit.timeit(lambda: [legado(t) for t in MENSAGENS], number=repeticoes)
+    t_novo = timeit.timeit(lambda: [novo(t) for t in MENSAGENS], number=repeticoes)
+    por_mensagem = repeticoes * len(MENSAGENS)
+    print(f"Todas as tabelas, buscas separadas: {t_legado / por_mensagem * 1e6:.1f} us/mensagem")
+    print(f"Todas as tabelas, varredura única:  {t_novo / por_mensagem * 1e6:.1f} us/mensagem")
+    print(f"Ganho: {t_legado / t_novo:.1f}x")
+
+    personality_manager = PersonalityManager()
+    text_analyzer = TextAnalyzer()
+
+    def mensagem_nova():
+        for texto in MENSAGENS:
+            KEYWORDS.scan.cache_clear()
+            analisadores(texto, personality_manager, text_analyzer)
+
+    t_analisadores = timeit.timeit(mensagem_nova, number=repeticoes)
+    print(f"Analisadores de uma mensagem (uma varredura compartilhada): {t_analisadores / por_mensagem * 1e6:.1f} us/mensagem")
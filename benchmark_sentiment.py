@@ -0,0 +1,114 @@
+import timeit
+
+from main import PortugueseSentimentAnalyzer, TextAnalyzer
+
+# Compara o léxico em português com o VADER (NLTK) em mensagens rotuladas manualmente.
+# O VADER é opcional: se o NLTK ou o vader_lexicon não estiverem instalados, só o léxico é medido.
+#
+# Todas as mensagens abaixo foram consultadas ao ajustar o léxico: a taxa de acerto é medida
+# dentro da amostra e não estima o desempenho em mensagens novas. Para isso seria preciso
+# rotular mensagens que não foram vistas durante o ajuste. Só as mensagens registradas vêm de
+# usuários reais, e são poucas; a comparação com o VADER deve ser lida com isso em mente.
+
+MENSAGENS_REGISTRADAS = [
+    # Mensagens registradas em bot_debug.log e user_memory.json
+    ("Me fale sobre as opções de investimento disponíveis no Brasil hoje. Quais você recomendaria para alguém que está começando e quais são as tendências?", "neutro"),
+    ("Olá", "neutro"),
+    ("quanto tá o dolar hoje?", "neutro"),
+    ("Estou começando a investir agora e preciso de ajuda, pois não sei como começar", "neutro"),
+    ("teria recomendações de vídeos, livros ou cursos?", "neutro"),
+    ("nunca ouvi falar sobre Nath Finanças", "neutro"),
+    ("é recomendavél para iniciantes, pois não sei absolutamente nada sobre investimentos", "neutro"),
+    ("Ok, obrigado pela ajuda", "positivo"),
+    ("Start", "neutro"),
+    ("Quero saber mais sobre CDBs", "neutro"),
+    ("O que você é capaz de fazer?", "neutro"),
+    ("Preciso de ajuda para começar a investir", "neutro"),
+    ("Quero saber de notícias", "neutro"),
+    ("Finanças", "neutro"),
+    ("Não sei", "neutro"),
+    ("Lula", "neutro"),
+    ("Bolsonaro", "neutro"),
+    ("Quanto tá o dólar?", "neutro"),
+]
+
+MENSAGENS_DO_DOMINIO = [
+    # Mensagens típicas do domínio, escritas para o benchmark
+    ("Muito obrigado, a explicação foi ótima!", "positivo"),
+    ("Adorei as dicas, ajudou demais", "positivo"),
+    ("Consegui quitar minhas dívidas, estou muito feliz", "positivo"),
+    ("Minhas ações subiram e tive um lucro bom esse mês", "positivo"),
+    ("Valeu! Deu certo aqui 👍", "positivo"),
+    ("Excelente resposta, parabéns", "positivo"),
+    ("O tesouro direto rendeu bem, estou satisfeito", "positivo"),
+    ("Perdi muito dinheiro com cripto, estou desesperado", "negativo"),
+    ("Estou preocupado com a crise e com medo de perder tudo", "negativo"),
+    ("Caí num golpe de pirâmide financeira", "negativo"),
+    ("Estou endividado e no vermelho, não sei o que fazer", "negativo"),
+    ("Essa corretora é péssima, tive prejuízo", "negativo"),
+    ("A bolsa despencou hoje 📉", "negativo"),
+    ("Não gostei da resposta, ficou confusa", "negativo"),
+    ("Não estou nada satisfeito com esse fundo", "negativo"),
+    ("O fundo era bom, mas teve uma queda horrível", "negativo"),
+    ("Isso não é ruim", "positivo"),
+    ("Qual a diferença entre CDB e LCI?", "neutro"),
+    ("Como declarar ações no imposto de renda?", "neutro"),
+    ("Quanto rende a poupança hoje?", "neutro"),
+    ("Vale a pena investir em FII?", "neutro"),
+    ("Me explica como funciona a taxa Selic", "neutro"),
+    # Perguntas sobre temas cujo nome também é palavra de sentimento
+    ("Vale a pena fazer o seguro do carro?", "neutro"),
+    ("Quanto custa um seguro de vida?", "neutro"),
+    ("Como funciona o seguro-desemprego?", "neutro"),
+    ("A previdência privada é segura?", "neutro"),
+    ("Como declarar o ganho de capital na venda do apartamento?", "neutro"),
+    ("Como calcular o imposto sobre o lucro das ações?", "neutro"),
+    ("Posso compensar a perda na bolsa no imposto de renda?", "neutro"),
+    ("Como abater o prejuízo de day trade no IR?", "neutro"),
+    ("O que acontece com a poupança com a queda da Selic?", "neutro"),
+    ("O que é recuperação judicial de uma empresa?", "neutro"),
+    ("Qual a valorização média dos imóveis em São Paulo?", "neutro"),
+    ("Fiquei feliz com o ganho desse mês", "positivo"),
+    # Erro conhecido: "arrasado" não está no léxico e a mensagem sai neutra
+    ("Tive uma perda enorme com essa ação, estou arrasado", "negativo"),
+]
+
+CONJUNTOS = [
+    ("mensagens registradas", MENSAGENS_REGISTRADAS),
+    ("mensagens do domínio", MENSAGENS_DO_DOMINIO),
+]
+MENSAGENS_ROTULADAS = MENSAGENS_REGISTRADAS + MENSAGENS_DO_DOMINIO
+
+
+def rotulo(pontuacao):
+    """Reduz os rótulos do bot a positivo, negativo e neutro."""
+    return TextAnalyzer._sentiment_label(pontuacao).replace("muito_", "")
+
+
+def avaliar(nome, pontuar):
+    repeticoes = 300
+    tempo = timeit.timeit(lambda: [pontuar(texto) for texto, _ in MENSAGENS_ROTULADAS], number=repeticoes)
+    por_mensagem = tempo / (repeticoes * len(MENSAGENS_ROTULADAS))
+    print(f"{nome} (acertos dentro da amostra, {por_mensagem * 1e6:.1f} us/mensagem):")
+    for conjunto, mensagens in CONJUNTOS:
+        erros = [(texto, esperado) for texto, esperado in mensagens if rotulo(pontuar(texto)) != esperado]
+        print(f"  {conjunto}: {len(mensagens) - len(erros)}/{len(mensagens)}")
+        for texto, esperado in erros:
+            print(f"    erro: {texto!r} (esperado {esperado}, obtido {rotulo(pontuar(texto))})")
+
+
+if __name__ == "__main__":
+    analisador = PortugueseSentimentAnalyzer()
+    avaliar("Léxico em português", analisador.score)
+
+    textos = [texto for texto, _ in MENSAGENS_ROTULADAS] * 20
+    tempo = timeit.timeit(lambda: analisador.score_many(textos), number=50)
+    print(f"Léxico em português (lote com repetições): {tempo / (50 * len(textos)) * 1e6:.1f} us/mensagem")
+
+    try:
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        vader = SentimentIntensityAnalyzer()
+    except (ImportError, LookupError):
+        print("VADER indisponível (instale nltk e o vader_lexicon para comparar)")
+    else:
+        avaliar("VADER", lambda texto: vader.polarity_scores(texto)["compound"])
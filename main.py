@@ -1,4 +1,5 @@
 import logging
+import logging.handlers
 import os
 import re
 import random
@@ -6,74 +7,650 @@ import time
 import sys
 import io
 import json
+import sqlite3
 import asyncio
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
+import threading
+import queue
+import atexit
+import unicodedata
+import heapq
+import bisect
+import itertools
+import zlib
+import functools
+import math
+from collections import OrderedDict, namedtuple, deque
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
-from openai import OpenAI
+from telegram.request import HTTPXRequest
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import traceback
-import requests
-from googlesearch import search
-from bs4 import BeautifulSoup
-import pymongo
-from pymongo import MongoClient
-import spacy
+import inspect
+import importlib
+import contextlib
 import socket
+import subprocess
 import telegram
-
-# Configuração de logging mais detalhada com tratamento para caracteres Unicode
-class UnicodeStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            stream = self.stream
-            # Substituindo caracteres Unicode problemáticos
-            msg = msg.encode('cp1252', errors='replace').decode('cp1252')
-            stream.write(msg + self.terminator)
-            self.flush()
-        except Exception:
-            self.handleError(record)
-
-# Configuração de logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot_debug.log', encoding='utf-8'),
-        UnicodeStreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
+import httpx
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 
 # Carregar variáveis de ambiente
 load_dotenv()
+
+# Configuração de logging: os registros entram em uma fila e a escrita (console e arquivo)
+# é feita por uma thread dedicada, sem I/O síncrono no caminho de cada requisição
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', 'bot_debug.log')  # vazio desativa o arquivo
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # rotação por tamanho
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')  # ex.: "midnight" troca a rotação por tamanho pela rotação por tempo
+# Níveis por logger no formato "nome=NIVEL,nome=NIVEL" (as bibliotecas HTTP são muito verbosas em DEBUG)
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING,httpcore=WARNING,telegram=INFO,openai=INFO')
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))  # fração dos registros DEBUG mantidos
+
+class DebugSampler(logging.Filter):
+    """Mantém apenas uma fração dos registros DEBUG; os demais níveis passam sempre."""
+    
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+def setup_logging():
+    """Configura o logging assíncrono e retorna o listener que escreve os registros."""
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    # Caracteres que o console não suporta (ex.: cp1252 no Windows) são substituídos pelo próprio stream
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(errors='replace')
+    handlers = [logging.StreamHandler(sys.stdout)]
+    
+    if LOG_FILE:
+        if LOG_ROTATE_WHEN:
+            handlers.append(logging.handlers.TimedRotatingFileHandler(
+                LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+            ))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+            ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Quem chama o logger só formata o registro e o coloca na fila
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    
+    for item in LOG_LEVELS.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+    
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Esvazia a fila e fecha os arquivos ao encerrar o processo
+    atexit.register(listener.stop)
+    return listener
+
+LOG_LISTENER = setup_logging()
+logger = logging.getLogger(__name__)
+
+class ComponentLoader:
+    """Carrega componentes pesados apenas no primeiro uso e mede o tempo da inicialização.
+    
+    Cada etapa da inicialização e cada componente carregado sob demanda fica registrado
+    com o tempo gasto, para o relatório de inicialização.
+    """
+    
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.startup_steps = OrderedDict()  # etapa -> segundos
+        self.load_times = OrderedDict()  # componente -> segundos
+        self._components = {}
+        self._lock = threading.Lock()  # Componentes podem ser pedidos por threads (ex.: parsing de HTML)
+    
+    def get(self, name, loader):
+        """Retorna o componente, executando o carregador na primeira chamada."""
+        if name in self._components:
+            return self._components[name]
+        
+        with self._lock:
+            if name not in self._components:
+                started = time.perf_counter()
+                self._components[name] = loader()
+                self.load_times[name] = time.perf_counter() - started
+                logger.info(f"Componente carregado sob demanda: {name} ({self.load_times[name]:.2f} s)")
+        return self._components[name]
+    
+    def module(self, module_name, attribute=None):
+        """Importa um módulo (ou um atributo dele) sob demanda."""
+        name = f"{module_name}.{attribute}" if attribute else module_name
+        
+        def load():
+            module = importlib.import_module(module_name)
+            return getattr(module, attribute) if attribute else module
+        
+        return self.get(name, load)
+    
+    @contextlib.contextmanager
+    def step(self, name):
+        """Mede uma etapa da inicialização."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_steps[name] = time.perf_counter() - started
+    
+    @staticmethod
+    def peak_memory_mb():
+        """Pico de memória residente do processo em MB, quando disponível."""
+        try:
+            import resource
+        except ImportError:  # Windows
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    
+    def report(self):
+        """Relatório de inicialização: etapas, componentes carregados e memória."""
+        lines = [f"Inicialização concluída em {time.perf_counter() - self.started_at:.2f} s"]
+        peak_memory = self.peak_memory_mb()
+        if peak_memory is not None:
+            lines[0] += f" (pico de memória: {peak_memory:.1f} MB)"
+        for name, elapsed in self.startup_steps.items():
+            lines.append(f"  - {name}: {elapsed:.2f} s")
+        if self.load_times:
+            loaded = ", ".join(f"{name} ({elapsed:.2f} s)" for name, elapsed in self.load_times.items())
+            lines.append(f"  Componentes carregados: {loaded}")
+        else:
+            lines.append("  Componentes carregados: nenhum (carregados apenas no primeiro uso)")
+        return "\n".join(lines)
+
+COMPONENTS = ComponentLoader()
+
 TOKEN = os.getenv('TELEGRAM_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# Limite global de chamadas simultâneas à API da OpenAI
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '20'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+
+# Updates processados em paralelo (usuários diferentes); os de um mesmo usuário seguem em ordem
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+
+# Envio progressivo das respostas (edição da mensagem conforme os tokens chegam)
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))  # segundos entre edições
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Busca de páginas da pesquisa web
+SEARCH_FETCH_TIMEOUT = float(os.getenv('SEARCH_FETCH_TIMEOUT', '5'))  # timeout por página
+SEARCH_DEADLINE = float(os.getenv('SEARCH_DEADLINE', '6'))  # prazo total da pesquisa (Google e páginas)
+SEARCH_PER_HOST_LIMIT = int(os.getenv('SEARCH_PER_HOST_LIMIT', '2'))
+SEARCH_MAX_CONNECTIONS = int(os.getenv('SEARCH_MAX_CONNECTIONS', '20'))
+
+# Cache de resultados da pesquisa web
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '256'))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '1800'))  # consultas gerais: 30 minutos
+SEARCH_CACHE_TTL_VOLATILE = int(os.getenv('SEARCH_CACHE_TTL_VOLATILE', '300'))  # cotações e notícias: 5 minutos
+
+# Cache do conteúdo extraído das páginas (revalidado com ETag/Last-Modified)
+PAGE_CACHE_FILE = os.getenv('PAGE_CACHE_FILE', 'page_cache.json')  # vazio desativa a persistência
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', '500'))
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', '21600'))  # entradas frescas por 6 horas
+
+# Journal da memória local: entradas acumuladas antes de compactar no snapshot
+USER_MEMORY_COMPACT_EVERY = int(os.getenv('USER_MEMORY_COMPACT_EVERY', '500'))
+
+# Gravação adiada (write-behind) da memória local: usuários alterados são gravados em lote
+USER_MEMORY_WRITE_BEHIND = os.getenv('USER_MEMORY_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+USER_MEMORY_FLUSH_INTERVAL = float(os.getenv('USER_MEMORY_FLUSH_INTERVAL', '5'))  # segundos
+USER_MEMORY_FLUSH_THRESHOLD = int(os.getenv('USER_MEMORY_FLUSH_THRESHOLD', '50'))  # usuários alterados
+
+# Armazenamento local: "json" (user_memory.json + journal) ou "sqlite"
+LOCAL_STORAGE = os.getenv('LOCAL_STORAGE', 'json').lower()
+SQLITE_DB_FILE = os.getenv('SQLITE_DB_FILE', 'user_memory.db')
+SQLITE_USER_CACHE_SIZE = int(os.getenv('SQLITE_USER_CACHE_SIZE', '1000'))  # usuários mantidos em memória
+
+# Conexão com o MongoDB
+MONGODB_ASYNC = os.getenv('MONGODB_ASYNC', 'false').lower() in ('1', 'true', 'yes')  # driver assíncrono (Motor)
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '50'))
+MONGODB_TIMEOUT_MS = int(os.getenv('MONGODB_TIMEOUT_MS', '5000'))
+MONGODB_READ_PREFERENCE = os.getenv('MONGODB_READ_PREFERENCE', 'primary')
+
+# Gravação em lote das interações no MongoDB (bulk_write não ordenado)
+MONGODB_BULK_WRITES = os.getenv('MONGODB_BULK_WRITES', 'false').lower() in ('1', 'true', 'yes')
+MONGODB_BULK_BATCH_SIZE = int(os.getenv('MONGODB_BULK_BATCH_SIZE', '100'))  # usuários por lote
+MONGODB_BULK_INTERVAL = float(os.getenv('MONGODB_BULK_INTERVAL', '1.0'))  # segundos entre gravações
+MONGODB_BULK_MAX_PENDING = int(os.getenv('MONGODB_BULK_MAX_PENDING', '1000'))  # limite da fila antes de gravar na hora
+
+# Cache local dos documentos de usuário do MongoDB (leitura com write-through)
+MONGODB_USER_CACHE_SIZE = int(os.getenv('MONGODB_USER_CACHE_SIZE', '1000'))
+MONGODB_USER_CACHE_TTL = int(os.getenv('MONGODB_USER_CACHE_TTL', '300'))
+
+# Cache de respostas do OpenAIAdvisor
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))  # 1 hora
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '5000'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))  # 50 MB
+
+# Correspondência aproximada de perguntas no cache de respostas (MinHash/LSH local)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.6'))  # similaridade de Jaccard mínima
+
+# Respostas pré-geradas e compartilhadas para os botões do menu
+MENU_ANSWERS_PREWARM = os.getenv('MENU_ANSWERS_PREWARM', 'false').lower() in ('1', 'true', 'yes')
+MENU_ANSWERS_REFRESH_INTERVAL = int(os.getenv('MENU_ANSWERS_REFRESH_INTERVAL', '3600'))  # segundos
+MENU_ANSWERS_VOLATILE_REFRESH_INTERVAL = int(os.getenv('MENU_ANSWERS_VOLATILE_REFRESH_INTERVAL', '900'))  # mercado e notícias
+
+# Diretório com os modelos de NLP empacotados pelo comando de preflight
+MODELS_DIR = os.getenv('MODELS_DIR', 'models')
+SPACY_MODEL = os.getenv('SPACY_MODEL', 'pt_core_news_sm')  # único modelo empacotado pelo preflight
+
+# Tempo por etapa do atendimento, exibido pelo comando /stats (restrito aos administradores)
+STAGE_TIMINGS_WINDOW = int(os.getenv('STAGE_TIMINGS_WINDOW', '1000'))  # amostras recentes mantidas por etapa
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()}
+
+# Endpoint de métricas no formato do Prometheus (desativado com a porta 0)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
 # Estados para o ConversationHandler
 WAITING_RESPONSE = 0
 FOLLOW_UP = 1
 
-# Tentar baixar recursos do NLTK se ainda não foram baixados
-try:
-    nltk.data.find('vader_lexicon')
-except LookupError:
-    logger.info("Baixando recursos NLTK necessários...")
-    nltk.download('vader_lexicon')
-
-# Tentar carregar modelo spaCy para português
-try:
-    nlp = spacy.load("pt_core_news_sm")
-except OSError:
-    logger.warning("Modelo spaCy para português não encontrado. Usando modelo em inglês como fallback.")
-    try:
-        nlp = spacy.load("en_core_web_sm")
-    except OSError:
-        logger.error("Nenhum modelo spaCy encontrado. Funcionalidades de NLP serão limitadas.")
-        nlp = None
+class ModelBundle:
+    """Modelos de NLP empacotados em um diretório local pelo comando de preflight.
+    
+    `python main.py --preflight` baixa os modelos uma única vez e grava um manifesto;
+    em execução, o bot apenas lê o manifesto e carrega os modelos do disco, sem downloads.
+    """
+    
+    # Modelo spaCy usado só se o configurado não puder ser empacotado
+    FALLBACK_SPACY_MODEL = "en_core_web_sm"
+    MANIFEST_FILE = "manifest.json"
+    
+    def __init__(self, models_dir, spacy_model=SPACY_MODEL):
+        self.models_dir = models_dir
+        self.spacy_model = spacy_model
+        self.manifest_file = os.path.join(models_dir, self.MANIFEST_FILE)
+        self.manifest = None
+    
+    def check(self):
+        """Lê o manifesto e indica se há modelos prontos para uso, sem acessar a rede."""
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+            logger.warning(f"Manifesto de modelos não encontrado em {self.manifest_file}. Execute 'python main.py --preflight' para empacotar os modelos de NLP.")
+            return False
+        except (OSError, json.JSONDecodeError) as e:
+            self.manifest = {}
+            logger.error(f"Erro ao ler o manifesto de modelos: {str(e)}")
+            return False
+        
+        spacy_models = self.manifest.get("spacy_models", {})
+        if not spacy_models:
+            logger.warning("Manifesto de modelos sem nenhum modelo spaCy. Funcionalidades de NLP serão limitadas.")
+            return False
+        logger.info(f"Modelos de NLP prontos: {', '.join(spacy_models)} (empacotados em {self.manifest.get('created_at')})")
+        return True
+    
+    def load_spacy(self):
+        """Carrega do disco o modelo spaCy configurado ou, sem ele, outro disponível no manifesto."""
+        if self.manifest is None:
+            self.check()
+        
+        spacy_models = self.manifest.get("spacy_models", {})
+        for model_name in dict.fromkeys([self.spacy_model, self.FALLBACK_SPACY_MODEL, *spacy_models]):
+            entry = spacy_models.get(model_name)
+            if not entry:
+                continue
+            try:
+                spacy = importlib.import_module("spacy")
+                return spacy.load(os.path.join(self.models_dir, entry["path"]))
+            except Exception as e:
+                logger.warning(f"Não foi possível carregar o modelo spaCy {model_name}: {str(e)}")
+        
+        logger.error("Nenhum modelo spaCy empacotado. Funcionalidades de NLP serão limitadas.")
+        return None
+    
+    def build(self):
+        """Baixa o modelo configurado, grava-o no diretório local e escreve o manifesto.
+        
+        O modelo alternativo só é baixado se o configurado não puder ser empacotado.
+        """
+        spacy = importlib.import_module("spacy")
+        os.makedirs(self.models_dir, exist_ok=True)
+        
+        spacy_models = {}
+        for model_name in dict.fromkeys([self.spacy_model, self.FALLBACK_SPACY_MODEL]):
+            if spacy_models:
+                break
+            try:
+                if not spacy.util.is_package(model_name):
+                    logger.info(f"Baixando modelo spaCy {model_name}...")
+                    subprocess.run([sys.executable, "-m", "spacy", "download", model_name], check=True)
+                    importlib.invalidate_caches()  # Torna o pacote recém-instalado visível
+                
+                nlp = spacy.load(model_name)
+                nlp.to_disk(os.path.join(self.models_dir, model_name))
+                spacy_models[model_name] = {"path": model_name, "version": nlp.meta.get("version")}
+                logger.info(f"Modelo spaCy {model_name} empacotado em {self.models_dir}")
+            except Exception as e:
+                logger.warning(f"Não foi possível empacotar o modelo spaCy {model_name}: {str(e)}")
+        
+        manifest = {
+            "created_at": datetime.now().isoformat(),
+            "spacy_version": spacy.__version__,
+            "spacy_models": spacy_models
+        }
+        # Escrita atômica: o bot nunca lê um manifesto pela metade
+        temp_file = f"{self.manifest_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.manifest_file)
+        
+        logger.info(f"Manifesto de modelos gravado em {self.manifest_file}")
+        return bool(spacy_models)
+
+MODEL_BUNDLE = ModelBundle(MODELS_DIR)
+
+class StageTimings:
+    """Tempo gasto em cada etapa do atendimento (pausas, análise, pesquisa, OpenAI, armazenamento, envios).
+    
+    Mantém em memória as amostras mais recentes de cada etapa e calcula os percentis sob demanda.
+    """
+    
+    PERCENTILES = (50, 95, 99)
+    # Limites (em segundos) do histograma acumulado exportado para o Prometheus
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    
+    def __init__(self, window):
+        self.window = window
+        self.samples = {}  # etapa -> durações mais recentes, em segundos
+        self.buckets = {}  # etapa -> medições por faixa de BUCKETS, desde a inicialização
+        self.counts = {}  # etapa -> medições desde a inicialização
+        self.totals = {}  # etapa -> tempo acumulado desde a inicialização
+    
+    def observe(self, stage, seconds):
+        """Registra uma medição da etapa."""
+        if stage not in self.samples:
+            self.samples[stage] = deque(maxlen=self.window)
+            self.buckets[stage] = [0] * (len(self.BUCKETS) + 1)
+        self.samples[stage].append(seconds)
+        self.buckets[stage][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+    
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Mede o bloco como uma execução da etapa."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+    
+    def timed(self, stage):
+        """Decorador que mede cada execução de uma corrotina como uma etapa."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def percentiles(self, stage):
+        """Percentis (nearest-rank) das amostras recentes da etapa, em segundos."""
+        ordered = sorted(self.samples.get(stage, ()))
+        if not ordered:
+            return {}
+        return {p: ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in self.PERCENTILES}
+    
+    def report(self):
+        """Resumo por etapa, da que mais consumiu tempo para a que menos consumiu."""
+        if not self.samples:
+            return "Nenhuma etapa medida ainda."
+        lines = []
+        for stage in sorted(self.samples, key=self.totals.get, reverse=True):
+            values = self.percentiles(stage)
+            lines.append(
+                f"{stage}: n={self.counts[stage]}, "
+                + ", ".join(f"p{p}={values[p] * 1000:.0f} ms" for p in self.PERCENTILES)
+                + f", total={self.totals[stage]:.1f} s"
+            )
+        return "\n".join(lines)
+
+TIMINGS = StageTimings(STAGE_TIMINGS_WINDOW)
+
+class MetricsRegistry:
+    """Contadores e medidores do bot, exportados junto com os histogramas de TIMINGS."""
+    
+    # Nome -> (tipo, descrição) no formato de texto do Prometheus
+    DEFINITIONS = OrderedDict([
+        ("bot_updates_total", ("counter", "Updates do Telegram recebidos, por tipo")),
+        ("bot_generations_in_flight", ("gauge", "Chamadas à OpenAI em andamento")),
+        ("bot_openai_tokens_total", ("counter", "Tokens consumidos nas chamadas à OpenAI sem streaming")),
+        ("bot_update_queue_depth", ("gauge", "Updates aguardando processamento (fila da Application, lock do usuário ou limite de concorrência)")),
+        ("bot_cache_hit_ratio", ("gauge", "Taxa de acerto dos caches desde a inicialização")),
+        ("bot_cache_entries", ("gauge", "Entradas mantidas em cada cache")),
+        ("bot_event_loop_lag_seconds", ("gauge", "Atraso do event loop em relação a um timer periódico")),
+    ])
+    
+    def __init__(self):
+        self.values = OrderedDict()  # (nome, rótulos) -> valor
+    
+    def inc(self, name, value=1, **labels):
+        """Incrementa um contador (ou medidor)."""
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + value
+    
+    def set(self, name, value, **labels):
+        """Define o valor atual de um medidor."""
+        self.values[(name, tuple(sorted(labels.items())))] = value
+    
+    @contextlib.contextmanager
+    def in_flight(self, name, **labels):
+        """Mantém o medidor incrementado enquanto o bloco executa."""
+        self.inc(name, **labels)
+        try:
+            yield
+        finally:
+            self.inc(name, -1, **labels)
+
+METRICS = MetricsRegistry()
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """Requisições à API do Telegram com o tempo de cada método registrado em TIMINGS."""
+    
+    async def do_request(self, url, *args, **kwargs):
+        with TIMINGS.span(f"telegram: {url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, *args, **kwargs)
+
+# Tabelas de palavras-chave usadas na análise das mensagens ({tabela: {categoria: [palavras]}}),
+# compiladas uma única vez no KeywordMatcher. Palavras entre espaços casam apenas como palavra inteira.
+KEYWORD_TABLES = {
+    # Termos técnicos ou complexos (complexidade do texto)
+    "complexity": {
+        "financial_terms": ["investimento", "ações", "rendimento", "tributação", "dividendos", 
+                            "volatilidade", "liquidez", "benchmark", "hedge", "alavancagem", 
+                            "derivativos", "criptomoedas", "análise", "rentabilidade"]
+    },
+    # Palavras-chave para categorizar o tipo de consulta (escolha da personalidade)
+    "personality": {
+        "technical": ["análise", "técnica", "gráfico", "indicadores", "tendência", 
+                      "mercado", "economia", "taxa", "rendimento", "comparativo"],
+        "friendly": ["começando", "iniciante", "básico", "simples", "fácil", 
+                     "entender", "ajuda", "dúvida", "conselho"],
+        "mentor": ["planejar", "futuro", "longo prazo", "aposentadoria", "objetivo", 
+                   "meta", "sonho", "realizar", "educar", "aprender"]
+    },
+    # Tópicos financeiros para detectar
+    "topics": {
+        "investimentos": ["investir", "investimento", "aplicar", "aplicação", "retorno"],
+        "renda_fixa": ["renda fixa", "tesouro", "cdb", "lci", "lca", "poupança"],
+        "renda_variável": ["ações", "bolsa", "fii", "etf", "bdr", "dividendos"],
+        "criptomoedas": ["cripto", "bitcoin", "ethereum", "blockchain", "token", "nft"],
+        "planejamento": ["planejar", "planejamento", "orçamento", "meta", "objetivo"],
+        "aposentadoria": ["aposentar", "aposentadoria", "previdência", "inss", "velhice"],
+        "educação_financeira": ["educação", "aprender", "conhecimento", "curso", "livro"],
+        "economia": ["economia", "mercado", "taxa", "juros", "inflação", "pib", "selic"],
+        "impostos": ["imposto", "tributo", "ir", "declaração", "restituição", "fisco"],
+        "dívidas": ["dívida", "empréstimo", "financiamento", "crédito", "parcelar"],
+        "seguros": ["seguro", "proteção", "sinistro", "cobertura", "apólice"]
+    },
+    # Complexidade da pergunta
+    "question": {
+        # Pedido de explicação detalhada
+        "detail": ["explique", "detalhe", "explica", "como funciona", 
+                   "aprofunde", "elabore", "descreva", "mais informações"],
+        "technical": ["alocação", "diversificação", "benchmark", "volatilidade", 
+                      "correlação", "liquidez", "taxa", "rendimento", "tributação"],
+        # Perguntas que precisam de "reflexão" antes da resposta
+        "reflection": ["explique", "detalhe", "como"]
+    },
+    # Expressões regionais (apenas palavras inteiras)
+    "regions": {
+        "sudeste": [" uai ", " pô ", " mano ", " meu ", " cara ", " da hora ", " maneiro "],
+        "nordeste": [" oxe ", " eita ", " vixe ", " massa ", " arretado ", " bichinho "],
+        "sul": [" tchê ", " bah ", " tri ", " guri ", " pila ", " capaz "],
+        "norte": [" égua ", " mana ", " parente ", " igarapé "],
+        "centro_oeste": [" trem ", " ocê ", " mió ", " véi "]
+    },
+    # Necessidade de informações atualizadas (pesquisa na web)
+    "search": {
+        "message": ["atual", "hoje", "recente", "notícia", "mercado", "taxa", "cotação", "preço", 
+                    "inflação", "selic", "dólar", "euro", "bolsa", "tendência", "projeção", "previsão"],
+        "generation": ["atual", "hoje", "recente", "notícia", "mercado", "taxa", "cotação", "preço", 
+                       "inflação", "selic", "dólar", "euro", "bolsa"]
+    },
+    # Preferências declaradas pelo usuário (memória de longo prazo)
+    "preferences": {
+        "risco": ["conservador", "moderado", "arrojado", "agressivo", "cauteloso"],
+        "horizonte": ["curto prazo", "médio prazo", "longo prazo"],
+        "objetivo": ["aposentadoria", "casa própria", "viagem", "educação", "independência"]
+    },
+    # Palavras de transição que indicam mudança de assunto
+    "transition": {
+        "transition": ["outra", "diferente", "novo", "mudar", "outro assunto", "falando em"]
+    },
+    # Tópicos de interesse registrados no MongoDB
+    "interests": {
+        "investimentos": ["investir", "investimento", "ação", "ações", "bolsa"],
+        "renda_fixa": ["renda fixa", "cdb", "tesouro", "lci", "lca"],
+        "aposentadoria": ["aposentadoria", "previdência", "inss", "aposentar"],
+        "dívidas": ["dívida", "dívidas", "empréstimo", "crédito", "financiamento"],
+        "economia": ["economia", "poupar", "economizar", "gastos"],
+        "educação_financeira": ["educação financeira", "aprender", "finanças"],
+        "impostos": ["imposto", "impostos", "ir", "declaração"],
+        "imóveis": ["imóvel", "imóveis", "casa", "apartamento", "financiamento"]
+    }
+}
+
+class KeywordMatcher:
+    """Casa todas as tabelas de palavras-chave em uma única passada sobre o texto.
+    
+    As palavras das tabelas ({tabela: {categoria: [palavras]}}) são compiladas em uma única
+    expressão regular em forma de trie. O resultado segue a semântica de `palavra in texto.lower()`
+    e as varreduras recentes ficam em cache, já que a mesma mensagem passa por vários analisadores.
+    """
+    
+    def __init__(self, tables, cache_size=256):
+        self.tables = tables
+        owners = {}  # palavra -> [(tabela, categoria)]
+        for table, categories in tables.items():
+            for category, keywords in categories.items():
+                for keyword in keywords:
+                    owners.setdefault(keyword, []).append((table, category))
+        
+        # Lookahead para testar todas as posições, inclusive casamentos sobrepostos
+        self._pattern = re.compile(f"(?=({self._trie_pattern(owners)}))")
+        # Em cada posição casa a palavra mais longa; as palavras contidas nela também estão no texto
+        self._implied = {
+            keyword: [
+                (table, category, other)
+                for other in owners if other in keyword
+                for table, category in owners[other]
+            ]
+            for keyword in owners
+        }
+        self.scan = functools.lru_cache(maxsize=cache_size)(self._scan)
+    
+    @staticmethod
+    def _trie_pattern(keywords):
+        """Monta uma expressão regular em forma de trie, preferindo sempre o casamento mais longo."""
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}  # Marca o fim de uma palavra
+        
+        def build(node):
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            # O quantificador guloso tenta primeiro continuar para uma palavra mais longa
+            return f"(?:{pattern})?" if "" in node else pattern
+        
+        return build(trie)
+    
+    def _scan(self, text):
+        """Varre o texto e retorna as palavras encontradas por tabela e categoria."""
+        hits = {}
+        # Espaços nas bordas para as palavras que só casam inteiras (ex.: " uai ")
+        for match in self._pattern.finditer(f" {(text or '').lower()} "):
+            for table, category, keyword in self._implied[match.group(1)]:
+                hits.setdefault((table, category), set()).add(keyword)
+        return KeywordHits(self.tables, hits)
+
+class KeywordHits:
+    """Resultado de uma varredura do KeywordMatcher (somente leitura, compartilhado pelo cache)."""
+    
+    __slots__ = ("_tables", "_hits")
+    
+    def __init__(self, tables, hits):
+        self._tables = tables
+        self._hits = hits  # (tabela, categoria) -> palavras encontradas
+    
+    def get(self, table, category):
+        """Palavras da categoria encontradas no texto."""
+        return self._hits.get((table, category), frozenset())
+    
+    def count(self, table, category):
+        """Quantidade de palavras distintas da categoria encontradas no texto."""
+        return len(self.get(table, category))
+    
+    def any(self, table, category):
+        """Indica se alguma palavra da categoria aparece no texto."""
+        return (table, category) in self._hits
+    
+    def categories(self, table):
+        """Categorias da tabela com alguma palavra encontrada, na ordem da tabela."""
+        return [category for category in self._tables[table] if (table, category) in self._hits]
+    
+    def ordered(self, table, category):
+        """Palavras da categoria encontradas no texto, na ordem da tabela."""
+        found = self.get(table, category)
+        return [keyword for keyword in self._tables[table][category] if keyword in found]
+
+KEYWORDS = KeywordMatcher(KEYWORD_TABLES)
 
 class PersonalityManager:
     """Gerencia diferentes personalidades e estilos conversacionais para o bot."""
@@ -256,11 +833,7 @@ class PersonalityManager:
         avg_word_length = sum(len(word) for word in words) / word_count if word_count > 0 else 0
         
         # Analisando presença de termos técnicos ou complexos
-        financial_terms = ["investimento", "ações", "rendimento", "tributação", "dividendos", 
-                         "volatilidade", "liquidez", "benchmark", "hedge", "alavancagem", 
-                         "derivativos", "criptomoedas", "análise", "rentabilidade"]
-        
-        technical_count = sum(1 for term in financial_terms if term in text.lower())
+        technical_count = KEYWORDS.scan(text).count("complexity", "financial_terms")
         
         # Determinando complexidade
         if word_count > 20 and (avg_word_length > 6 or technical_count >= 3):
@@ -276,21 +849,11 @@ class PersonalityManager:
         # Verifica complexidade do texto
         complexity = self.analyze_text_complexity(text)
         
-        # Palavras-chave para categorizar o tipo de consulta
-        technical_keywords = ["análise", "técnica", "gráfico", "indicadores", "tendência", 
-                             "mercado", "economia", "taxa", "rendimento", "comparativo"]
-        
-        friendly_keywords = ["começando", "iniciante", "básico", "simples", "fácil", 
-                            "entender", "ajuda", "dúvida", "conselho"]
-        
-        mentor_keywords = ["planejar", "futuro", "longo prazo", "aposentadoria", "objetivo", 
-                          "meta", "sonho", "realizar", "educar", "aprender"]
-        
         # Contagem de palavras-chave no texto
-        text_lower = text.lower()
-        technical_count = sum(1 for keyword in technical_keywords if keyword in text_lower)
-        friendly_count = sum(1 for keyword in friendly_keywords if keyword in text_lower)
-        mentor_count = sum(1 for keyword in mentor_keywords if keyword in text_lower)
+        hits = KEYWORDS.scan(text)
+        technical_count = hits.count("personality", "technical")
+        friendly_count = hits.count("personality", "friendly")
+        mentor_count = hits.count("personality", "mentor")
         
         # Seleciona personalidade baseada na contagem e complexidade
         if complexity == "complexo" or technical_count >= 2:
@@ -354,17 +917,169 @@ class PersonalityManager:
         
         return modified_text
 
+class PortugueseSentimentAnalyzer:
+    """Análise de sentimento por léxico em português, com termos do contexto financeiro.
+    
+    O léxico é normalizado e compilado uma única vez (token sem acento -> pontuação).
+    Negações invertem e atenuam as palavras seguintes, intensificadores e atenuadores
+    ajustam a intensidade, e a pontuação final segue a escala "compound" do VADER
+    (-1 a 1), mantendo os limiares usados em TextAnalyzer.analyze_sentiment.
+    """
+    
+    # Substantivos que também nomeiam temas financeiros (seguro, lucro, ganho, perda,
+    # prejuízo, queda, valorização...) ficam de fora: "o seguro do carro" não é positivo
+    LEXICON = {
+        # Positivos
+        "bom": 1.9, "boa": 1.9, "bons": 1.9, "boas": 1.9, "ótimo": 3.0, "ótima": 3.0, "excelente": 3.2,
+        "maravilhoso": 3.1, "maravilhosa": 3.1, "perfeito": 2.8, "perfeita": 2.8, "incrível": 2.8,
+        "sensacional": 3.0, "legal": 1.8, "show": 2.0, "top": 2.0, "gostei": 2.0, "gosto": 1.5,
+        "adorei": 2.9, "amei": 3.0, "feliz": 2.7, "contente": 2.2, "satisfeito": 2.2, "satisfeita": 2.2,
+        "tranquilo": 1.3, "tranquila": 1.3, "tranquilidade": 1.8, "confiante": 1.8, "animado": 2.2,
+        "animada": 2.2, "empolgado": 2.4, "empolgada": 2.4, "obrigado": 1.6, "obrigada": 1.6,
+        "valeu": 1.6, "agradeço": 1.8, "parabéns": 2.4, "ajudou": 1.9, "útil": 1.5, "melhor": 1.4,
+        "melhorou": 1.9, "positivo": 1.5, "positiva": 1.5, "esperança": 1.6, "sucesso": 2.3,
+        "conquista": 2.0, "consegui": 1.8, "lucrei": 2.2, "lucrando": 2.0, "lucrativo": 1.8, "ganhei": 2.0,
+        "rendeu": 1.5, "rentável": 1.6, "valorizou": 1.9, "subiu": 1.3, "disparou": 1.5, "recuperou": 1.5,
+        "vantajoso": 1.8, "vantagem": 1.3, "oportunidade": 1.4, "estabilidade": 1.2, "quitei": 2.2,
+        "economizei": 1.8, "realizado": 1.5,
+        # Negativos
+        "ruim": -2.2, "ruins": -2.2, "péssimo": -3.1, "péssima": -3.1, "horrível": -3.0, "terrível": -3.0,
+        "pior": -2.2, "piorou": -2.3, "triste": -2.3, "chateado": -2.1, "chateada": -2.1,
+        "frustrado": -2.4, "frustrada": -2.4, "decepcionado": -2.5, "decepcionada": -2.5,
+        "decepção": -2.4, "preocupado": -2.0, "preocupada": -2.0, "preocupação": -1.8,
+        "preocupante": -2.0, "medo": -2.0, "receio": -1.5, "inseguro": -1.7, "insegura": -1.7,
+        "ansioso": -1.8, "ansiosa": -1.8, "ansiedade": -1.8, "desesperado": -3.0, "desesperada": -3.0,
+        "nervoso": -1.6, "nervosa": -1.6, "odeio": -3.2, "odiei": -3.0, "raiva": -2.7, "absurdo": -2.2,
+        "injusto": -2.0, "errado": -1.6, "erro": -1.5, "problema": -1.6, "problemas": -1.6,
+        "difícil": -1.2, "dificuldade": -1.4, "dificuldades": -1.4, "confuso": -1.3, "confusa": -1.3,
+        "negativo": -1.5, "negativa": -1.5, "perdi": -2.3, "perdendo": -2.1, "caiu": -1.5,
+        "despencou": -2.5, "desvalorizou": -1.9, "crise": -2.2, "calote": -2.8, "golpe": -2.8,
+        "fraude": -2.9, "roubo": -2.8, "endividado": -2.4, "endividada": -2.4, "inadimplente": -2.2,
+        "falência": -2.8, "faliu": -2.8, "quebrou": -2.5, "arriscado": -1.0, "caro": -1.0,
+        # Emojis
+        "👍": 1.8, "😊": 2.0, "🙂": 1.5, "😀": 2.0, "😄": 2.2, "❤": 2.5, "🚀": 1.8, "📈": 1.4,
+        "😢": -2.2, "😞": -2.2, "😡": -2.8, "😭": -2.5, "😟": -2.0, "📉": -1.4,
+    }
+    
+    # Expressões de duas palavras avaliadas antes das palavras isoladas
+    PHRASES = {
+        "deu certo": 1.8, "de boa": 1.2, "deu errado": -2.0, "no vermelho": -2.0, "sem dinheiro": -1.8,
+    }
+    
+    NEGATIONS = {"não", "nao", "n", "nunca", "jamais", "nem", "nenhum", "nenhuma", "nada", "sem"}
+    
+    # Multiplicadores aplicados às palavras seguintes (ou à anterior, no caso de "demais")
+    INTENSIFIERS = {
+        "muito": 1.3, "muita": 1.3, "bastante": 1.3, "super": 1.4, "extremamente": 1.5, "totalmente": 1.3,
+        "tão": 1.3, "mega": 1.4, "pouco": 0.6, "meio": 0.7, "levemente": 0.7,
+    }
+    POSTPOSED_INTENSIFIERS = {"demais": 1.3}
+    
+    # Conjunções adversativas: o trecho depois delas pesa mais que o anterior
+    CONTRASTS = {"mas", "porém", "contudo", "entretanto", "todavia"}
+    
+    NEGATION_SCALAR = -0.74
+    NEGATION_WINDOW = 3
+    INTENSIFIER_WINDOW = 2
+    EXCLAMATION_BOOST = 0.292
+    NORMALIZATION_ALPHA = 15
+    
+    TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+    
+    # Remoção de acentos por tabela de tradução (mais rápida que normalizar cada caractere)
+    ACCENTS = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüç", "aaaaaeeeeiiiiooooouuuuc")
+    
+    def __init__(self):
+        self.lexicon = {self._fold(word): score for word, score in self.LEXICON.items()}
+        self.phrases = {tuple(self._fold(phrase).split()): score for phrase, score in self.PHRASES.items()}
+        self.phrase_starts = {words[0] for words in self.phrases}
+        self.negations = {self._fold(word) for word in self.NEGATIONS}
+        self.intensifiers = {self._fold(word): scale for word, scale in self.INTENSIFIERS.items()}
+        self.postposed_intensifiers = {self._fold(word): scale for word, scale in self.POSTPOSED_INTENSIFIERS.items()}
+        self.contrasts = {self._fold(word) for word in self.CONTRASTS}
+    
+    @classmethod
+    def _fold(cls, text):
+        """Minúsculas e sem acentos, para casar grafias com e sem acentuação."""
+        return text.lower().translate(cls.ACCENTS)
+    
+    def score(self, text):
+        """Retorna a pontuação de sentimento do texto, de -1 (negativo) a 1 (positivo)."""
+        if not text:
+            return 0.0
+        
+        tokens = self.TOKEN_PATTERN.findall(self._fold(text))
+        scores = []  # (posição, pontuação) de cada termo com sentimento
+        skip_next = False
+        for i, token in enumerate(tokens):
+            if skip_next:
+                skip_next = False
+                continue
+            
+            score = self.lexicon.get(token)
+            end = i + 1
+            if token in self.phrase_starts and end < len(tokens):
+                phrase_score = self.phrases.get((token, tokens[end]))
+                if phrase_score is not None:
+                    score, end, skip_next = phrase_score, end + 1, True
+            if score is None:
+                continue
+            
+            for previous in tokens[max(0, i - self.INTENSIFIER_WINDOW):i]:
+                score *= self.intensifiers.get(previous, 1)
+            if end < len(tokens):
+                score *= self.postposed_intensifiers.get(tokens[end], 1)
+            if not self.negations.isdisjoint(tokens[max(0, i - self.NEGATION_WINDOW):i]):
+                score *= self.NEGATION_SCALAR
+            scores.append((i, score))
+        
+        # Conjunção adversativa: atenua o que vem antes e reforça o que vem depois
+        total = 0.0
+        contrast = None
+        if scores and not self.contrasts.isdisjoint(tokens):
+            contrast = next(i for i, token in enumerate(tokens) if token in self.contrasts)
+        for position, score in scores:
+            if contrast is not None:
+                score *= 0.5 if position < contrast else 1.5
+            total += score
+        
+        # Exclamações reforçam o sentimento já presente
+        if total:
+            emphasis = min(tokens.count("!"), 4) * self.EXCLAMATION_BOOST
+            total += emphasis if total > 0 else -emphasis
+        
+        return total / math.sqrt(total * total + self.NORMALIZATION_ALPHA)
+    
+    def score_many(self, texts):
+        """Pontua vários textos de uma vez, calculando textos repetidos uma única vez."""
+        scores = {}
+        return [scores[text] if text in scores else scores.setdefault(text, self.score(text)) for text in texts]
+    
+    def polarity_scores(self, text):
+        """Interface compatível com o SentimentIntensityAnalyzer do NLTK."""
+        return {"compound": self.score(text)}
+
+class MessageAnalysis(namedtuple("MessageAnalysis", [
+    "text", "sentiment", "topics", "question_complexity", "region", "personality_type", "keywords"
+])):
+    """Análise imutável de uma mensagem, calculada uma vez e reaproveitada pelo bot, consultor e memória."""
+    
+    __slots__ = ()
+
 class TextAnalyzer:
     """Analisa texto para detectar sentimentos, tópicos e intenções."""
     
     def __init__(self):
         try:
-            self.sentiment_analyzer = SentimentIntensityAnalyzer()
-            self.nlp = nlp  # Usando o modelo spaCy carregado globalmente
+            self.sentiment_analyzer = PortugueseSentimentAnalyzer()
         except Exception as e:
             logger.error(f"Erro ao inicializar TextAnalyzer: {str(e)}")
             self.sentiment_analyzer = None
-            self.nlp = None
+    
+    @property
+    def nlp(self):
+        """Modelo spaCy, carregado apenas no primeiro uso."""
+        return COMPONENTS.get("spaCy", MODEL_BUNDLE.load_spacy)
     
     def analyze_sentiment(self, text):
         """Analisa o sentimento do texto."""
@@ -372,77 +1087,56 @@ class TextAnalyzer:
             return "neutro"
         
         try:
-            # Convertendo texto para inglês para análise VADER (temporário)
-            # Em um cenário real, usar um modelo de sentimento para português
-            sentiment_scores = self.sentiment_analyzer.polarity_scores(text)
-            compound = sentiment_scores["compound"]
-            
-            if compound >= 0.5:
-                return "muito_positivo"
-            elif compound >= 0.1:
-                return "positivo"
-            elif compound <= -0.5:
-                return "muito_negativo"
-            elif compound <= -0.1:
-                return "negativo"
-            else:
-                return "neutro"
+            return self._sentiment_label(self.sentiment_analyzer.score(text))
         except Exception as e:
             logger.error(f"Erro na análise de sentimento: {str(e)}")
             return "neutro"
     
+    def analyze_sentiments(self, texts):
+        """Analisa o sentimento de vários textos de uma vez."""
+        if not self.sentiment_analyzer:
+            return ["neutro"] * len(texts)
+        
+        try:
+            return [self._sentiment_label(score) for score in self.sentiment_analyzer.score_many(texts)]
+        except Exception as e:
+            logger.error(f"Erro na análise de sentimento em lote: {str(e)}")
+            return ["neutro"] * len(texts)
+    
+    @staticmethod
+    def _sentiment_label(compound):
+        """Converte a pontuação de sentimento (-1 a 1) no rótulo usado pelo bot."""
+        if compound >= 0.5:
+            return "muito_positivo"
+        elif compound >= 0.1:
+            return "positivo"
+        elif compound <= -0.5:
+            return "muito_negativo"
+        elif compound <= -0.1:
+            return "negativo"
+        else:
+            return "neutro"
+    
     def extract_topics(self, text):
         """Extrai tópicos principais do texto."""
-        topics = []
-        
         if not text:
-            return topics
-        
-        # Lista de tópicos financeiros para detectar
-        financial_topics = {
-            "investimentos": ["investir", "investimento", "aplicar", "aplicação", "retorno"],
-            "renda_fixa": ["renda fixa", "tesouro", "cdb", "lci", "lca", "poupança"],
-            "renda_variável": ["ações", "bolsa", "fii", "etf", "bdr", "dividendos"],
-            "criptomoedas": ["cripto", "bitcoin", "ethereum", "blockchain", "token", "nft"],
-            "planejamento": ["planejar", "planejamento", "orçamento", "meta", "objetivo"],
-            "aposentadoria": ["aposentar", "aposentadoria", "previdência", "inss", "velhice"],
-            "educação_financeira": ["educação", "aprender", "conhecimento", "curso", "livro"],
-            "economia": ["economia", "mercado", "taxa", "juros", "inflação", "pib", "selic"],
-            "impostos": ["imposto", "tributo", "ir", "declaração", "restituição", "fisco"],
-            "dívidas": ["dívida", "empréstimo", "financiamento", "crédito", "parcelar"],
-            "seguros": ["seguro", "proteção", "sinistro", "cobertura", "apólice"]
-        }
-        
-        text_lower = text.lower()
-        
-        for topic, keywords in financial_topics.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    topics.append(topic)
-                    break
+            return []
         
-        return topics
+        # Tópicos financeiros detectados, na ordem da tabela
+        return KEYWORDS.scan(text).categories("topics")
     
     def detect_question_complexity(self, text):
         """Detecta a complexidade da pergunta."""
         if not text:
             return "simples"
         
-        # Palavras-chave que indicam pedido de explicação detalhada
-        detail_keywords = ["explique", "detalhe", "explica", "como funciona", 
-                          "aprofunde", "elabore", "descreva", "mais informações"]
-        
-        # Palavras-chave técnicas
-        technical_keywords = ["alocação", "diversificação", "benchmark", "volatilidade", 
-                             "correlação", "liquidez", "taxa", "rendimento", "tributação"]
-        
-        text_lower = text.lower()
+        hits = KEYWORDS.scan(text)
         
         # Verificando presença de palavras-chave de detalhamento
-        has_detail_request = any(keyword in text_lower for keyword in detail_keywords)
+        has_detail_request = hits.any("question", "detail")
         
         # Verificando presença de termos técnicos
-        technical_count = sum(1 for keyword in technical_keywords if keyword in text_lower)
+        technical_count = hits.count("question", "technical")
         
         # Verificando comprimento da pergunta
         word_count = len(text.split())
@@ -455,27 +1149,26 @@ class TextAnalyzer:
         else:
             return "simples"
     
+    def analyze_message(self, text, personality_type=None):
+        """Executa todas as análises da mensagem de uma só vez."""
+        return MessageAnalysis(
+            text=text,
+            sentiment=self.analyze_sentiment(text),
+            topics=tuple(self.extract_topics(text)),
+            question_complexity=self.detect_question_complexity(text),
+            region=self.detect_user_region(text),
+            personality_type=personality_type,
+            keywords=KEYWORDS.scan(text or "")
+        )
+    
     def detect_user_region(self, text):
         """Tenta detectar a região do usuário com base em expressões regionais."""
         if not text:
             return None
         
-        # Expressões regionais para detecção
-        regional_markers = {
-            "sudeste": ["uai", "pô", "mano", "meu", "cara", "da hora", "maneiro"],
-            "nordeste": ["oxe", "eita", "vixe", "massa", "arretado", "bichinho"],
-            "sul": ["tchê", "bah", "tri", "guri", "pila", "capaz"],
-            "norte": ["égua", "mana", "parente", "igarapé"],
-            "centro_oeste": ["trem", "ocê", "mió", "véi"]
-        }
-        
-        text_lower = text.lower()
-        region_scores = {region: 0 for region in regional_markers}
-        
-        for region, markers in regional_markers.items():
-            for marker in markers:
-                if f" {marker} " in f" {text_lower} ":  # Adiciona espaços para evitar falsos positivos
-                    region_scores[region] += 1
+        # Expressões regionais encontradas (apenas palavras inteiras, para evitar falsos positivos)
+        hits = KEYWORDS.scan(text)
+        region_scores = {region: hits.count("regions", region) for region in KEYWORD_TABLES["regions"]}
         
         # Se encontrou marcadores, retorna a região com maior pontuação
         max_score = max(region_scores.values())
@@ -485,163 +1178,882 @@ class TextAnalyzer:
         
         return None  # Nenhuma região detectada
 
-class GoogleSearch:
-    """Classe para realizar pesquisas no Google e extrair informações relevantes."""
+class TTLCache:
+    """Cache em memória com expiração por entrada e descarte LRU, limitado por entradas e tamanho."""
     
-    @staticmethod
-    async def search_google(query, num_results=5):
-        """Realiza uma pesquisa no Google e retorna os resultados."""
-        try:
-            logger.info(f"Realizando pesquisa no Google para: {query}")
-            search_results = []
-            
-            # Realizando a pesquisa
-            search_urls = list(search(query, num_results=num_results, lang="pt", country="br", stop=num_results))
-            
-            if not search_urls:
-                logger.warning("Nenhum resultado encontrado na pesquisa.")
-                return []
-            
-            for url in search_urls:
-                try:
-                    # Ignorando URLs problemáticas comuns
-                    if any(blocked in url.lower() for blocked in ["youtube.com", "facebook.com", "instagram.com", "twitter.com", "tiktok.com"]):
-                        continue
-                        
-                    # Obtendo o conteúdo da página com timeout
-                    headers = {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                    }
-                    response = requests.get(url, headers=headers, timeout=5)
-                    
-                    if response.status_code == 200:
-                        # Parseando o HTML
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        
-                        # Obtendo o título
-                        title = soup.title.string if soup.title else "Sem título"
-                        
-                        # Obtendo um resumo do conteúdo (primeiros parágrafos)
-                        paragraphs = soup.find_all('p')
-                        content = ""
-                        for p in paragraphs[:5]:  # Pegando os 5 primeiros parágrafos
-                            if p.text and len(p.text.strip()) > 20:  # Evitando parágrafos vazios ou muito curtos
-                                content += p.text.strip() + " "
-                        
-                        if content:
-                            # Limpando o conteúdo (removendo caracteres especiais e formatação)
-                            content = re.sub(r'\s+', ' ', content)  # Substituindo múltiplos espaços por um único
-                            content = re.sub(r'[^\w\s.,;:!?()-]', '', content)  # Removendo caracteres especiais
-                            
-                            # Limitando o tamanho do conteúdo
-                            content = content[:500] + "..." if len(content) > 500 else content
-                            
-                            # Adicionando aos resultados
-                            search_results.append({
-                                "title": title,
-                                "url": url,
-                                "content": content
-                            })
-                    
-                except requests.exceptions.RequestException as e:
-                    logger.warning(f"Erro ao acessar URL {url}: {str(e)}")
-                    continue
-                except Exception as e:
-                    logger.warning(f"Erro ao processar URL {url}: {str(e)}")
-                    continue
-            
-            logger.info(f"Pesquisa concluída. Encontrados {len(search_results)} resultados.")
-            return search_results
-            
-        except Exception as e:
-            logger.error(f"Erro na pesquisa Google: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return []
+    def __init__(self, max_entries=1000, default_ttl=3600, max_bytes=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # chave -> (expira_em, valor, tamanho)
+        # Heap de expiração: remove entradas vencidas sem varrer o cache inteiro
+        self._expiry_heap = []  # (expira_em, sequência, chave)
+        self._sequence = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
     
-    @staticmethod
-    def format_search_results(results):
-        """Formata os resultados da pesquisa para uso no prompt."""
-        if not results:
-            return "Não foi possível encontrar resultados relevantes para esta pesquisa."
+    def _remove(self, key):
+        """Remove uma entrada e atualiza o tamanho total."""
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+    
+    def get(self, key):
+        """Retorna o valor em cache ou None se ausente ou expirado."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
         
-        formatted_results = "Resultados da pesquisa na web:\n\n"
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
         
-        for i, result in enumerate(results, 1):
-            formatted_results += f"{i}. {result['title']}\n"
-            formatted_results += f"URL: {result['url']}\n"
-            formatted_results += f"Resumo: {result['content']}\n\n"
+        # Marcando como usado recentemente
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def peek(self, key):
+        """Retorna o valor válido sem afetar estatísticas nem a ordem LRU."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+    
+    def discard(self, key):
+        """Remove a entrada, se existir."""
+        if key in self._entries:
+            self._remove(key)
+    
+    def set(self, key, value, ttl=None, size=0):
+        """Armazena um valor com TTL próprio (ou o padrão do cache) e tamanho estimado em bytes."""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value, size)
+        self.total_bytes += size
+        heapq.heappush(self._expiry_heap, (expires_at, next(self._sequence), key))
         
-        return formatted_results
+        # Descartando as entradas menos usadas recentemente
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes and self.total_bytes > self.max_bytes and len(self._entries) > 1
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        
+        # Reconstruindo o heap quando acumula muitas referências obsoletas
+        if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [
+                (expires_at, next(self._sequence), key) for key, (expires_at, _, _) in self._entries.items()
+            ]
+            heapq.heapify(self._expiry_heap)
+    
+    def purge_expired(self):
+        """Remove as entradas vencidas; custo proporcional apenas ao que expirou."""
+        now = time.monotonic()
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(key)
+            # Referências de entradas já sobrescritas ou removidas são ignoradas
+            if entry is not None and entry[0] == expires_at:
+                self._remove(key)
+                self.expirations += 1
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self):
+        """Retorna estatísticas de uso do cache."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
 
-class UserMemory:
-    """Classe para gerenciar a memória de interações com usuários."""
+class PageCache:
+    """Cache do conteúdo extraído de páginas web, com validadores HTTP e persistência em disco."""
     
-    def __init__(self):
-        self.user_data = {}
-        self.memory_file = "user_memory.json"
-        self.load_memory()
-        self.text_analyzer = TextAnalyzer()
+    SAVE_EVERY = 20  # alterações acumuladas antes de salvar em disco
     
-    def load_memory(self):
-        """Carrega a memória de usuários do arquivo."""
-        try:
-            if os.path.exists(self.memory_file):
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    self.user_data = json.load(f)
-                logger.info(f"Memória de usuários carregada: {len(self.user_data)} usuários")
-            else:
-                logger.info("Arquivo de memória não encontrado. Criando nova memória.")
-        except Exception as e:
-            logger.error(f"Erro ao carregar memória: {str(e)}")
+    def __init__(self, cache_file=None, max_entries=500, ttl=21600):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # url -> {title, content, etag, last_modified, fetched_at}
+        self._changes = 0
+        self._save_lock = asyncio.Lock()  # salvamentos simultâneos usariam o mesmo arquivo .tmp
+        self.load()
     
-    def save_memory(self):
-        """Salva a memória de usuários no arquivo."""
+    def load(self):
+        """Carrega o cache salvo em disco, se existir."""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
         try:
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.user_data, f, ensure_ascii=False, indent=2)
-            logger.info("Memória de usuários salva com sucesso")
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._entries = OrderedDict(json.load(f))
+            logger.info(f"Cache de páginas carregado: {len(self._entries)} URLs")
         except Exception as e:
-            logger.error(f"Erro ao salvar memória: {str(e)}")
+            logger.error(f"Erro ao carregar cache de páginas: {str(e)}")
     
-    def get_user_info(self, user_id):
-        """Obtém informações sobre um usuário específico."""
-        user_id_str = str(user_id)
-        if user_id_str not in self.user_data:
-            current_time = datetime.now().isoformat()
-            self.user_data[user_id_str] = {
-                "first_interaction": current_time,
-                "last_interaction": current_time,
-                "interaction_count": 0,
-                "topics": [],
-                "detected_region": None,
-                "detected_expertise": "iniciante",  # iniciante, intermediário, avançado
-                "sentiment_history": [],  # histórico de sentimentos detectados
-                "conversation_style": "default",  # estilo de conversa preferido
-                "conversation_history": [],
-                "personality_compatibility": {  # compatibilidade com cada personalidade
-                    "default": 0,
-                    "technical": 0,
-                    "friendly": 0,
-                    "mentor": 0
-                },
-                "long_term_memory": {  # memória de longo prazo
-                    "personal_details": {},
-                    "preferences": {},
-                    "important_dates": {},
-                    "significant_topics": [],
-                    "key_questions": []
-                },
-                "session_data": {  # dados da sessão atual
-                    "session_start": current_time,
-                    "queries_this_session": 0,
-                    "current_topic": None,
-                    "topic_continuity": False,
-                    "last_sentiment": "neutro"
-                }
-            }
-        return self.user_data[user_id_str]
+    def _write(self, data):
+        """Grava o cache em disco de forma atômica."""
+        temp_file = f"{self.cache_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_file, self.cache_file)
     
-    def update_user_interaction(self, user_id, user_message, bot_response):
+    async def save(self):
+        """Salva o cache em disco sem bloquear o event loop."""
+        if not self.cache_file:
+            return
+        async with self._save_lock:
+            self._changes = 0
+            try:
+                # A cópia é feita no event loop; apenas a escrita vai para outra thread
+                await asyncio.to_thread(self._write, dict(self._entries))
+            except Exception as e:
+                logger.error(f"Erro ao salvar cache de páginas: {str(e)}")
+    
+    def get(self, url):
+        """Retorna a entrada da URL (fresca ou não) ou None."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+    
+    def is_fresh(self, entry):
+        """Indica se a entrada pode ser usada sem revalidação."""
+        return time.time() - entry["fetched_at"] < self.ttl
+    
+    def touch(self, url):
+        """Marca a entrada como revalidada (resposta 304)."""
+        self._entries[url]["fetched_at"] = time.time()
+        self._changes += 1
+    
+    def set(self, url, title, content, etag=None, last_modified=None):
+        """Armazena o conteúdo extraído e os validadores da página."""
+        self._entries[url] = {
+            "title": title,
+            "content": content,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time()
+        }
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._changes += 1
+    
+    def needs_save(self):
+        """Indica se há alterações suficientes para salvar em disco."""
+        return bool(self.cache_file) and self._changes >= self.SAVE_EVERY
+
+class GoogleSearch:
+    """Classe para realizar pesquisas no Google e extrair informações relevantes."""
+    
+    # Domínios ignorados por não terem conteúdo textual útil
+    BLOCKED_DOMAINS = ["youtube.com", "facebook.com", "instagram.com", "twitter.com", "tiktok.com"]
+    
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    }
+    
+    # Palavras ignoradas na normalização das consultas
+    STOPWORDS = {
+        "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "da", "do", "das", "dos",
+        "em", "na", "no", "nas", "nos", "para", "pra", "por", "com", "e", "ou",
+        "que", "qual", "quais", "quanto", "quanta", "como", "esta", "estao", "eh",
+        "me", "meu", "minha", "se", "ao", "aos", "sobre", "mais", "muito", "voce"
+    }
+    
+    # Termos que indicam informação volátil (cache mais curto)
+    VOLATILE_TERMS = {"hoje", "agora", "cotacao", "dolar", "euro", "bolsa", "ibovespa", "noticia", "noticias", "preco"}
+    
+    # Cliente HTTP compartilhado (pool de conexões) e limites por host
+    _http_client = None
+    _host_semaphores = {}  # host -> [semáforo, requisições aguardando ou em andamento]
+    
+    # Threads próprias para a consulta ao Google: uma consulta que estoura o prazo continua
+    # rodando até o timeout do requests e não pode ocupar o executor usado no parsing
+    SEARCH_THREADS = 4
+    _search_executor = None
+    
+    # Cache de resultados e pesquisas em andamento (evita pesquisas duplicadas simultâneas)
+    _results_cache = TTLCache(max_entries=SEARCH_CACHE_SIZE, default_ttl=SEARCH_CACHE_TTL)
+    _page_cache = PageCache(PAGE_CACHE_FILE, max_entries=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+    _pending_searches = {}
+    
+    @classmethod
+    def normalize_query(cls, query):
+        """Normaliza a consulta: minúsculas, sem acentos, sem pontuação e sem stopwords."""
+        text = unicodedata.normalize("NFKD", query.lower())
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        tokens = re.findall(r"\w+", text)
+        return " ".join(sorted({token for token in tokens if token not in cls.STOPWORDS}))
+    
+    @classmethod
+    def _cache_ttl(cls, normalized_query):
+        """Define o TTL da entrada conforme a volatilidade do assunto."""
+        if cls.VOLATILE_TERMS.intersection(normalized_query.split()):
+            return SEARCH_CACHE_TTL_VOLATILE
+        return SEARCH_CACHE_TTL
+    
+    @classmethod
+    def cache_stats(cls):
+        """Retorna as estatísticas do cache de pesquisas."""
+        return cls._results_cache.stats()
+    
+    @classmethod
+    def _get_http_client(cls):
+        """Retorna o cliente HTTP assíncrono compartilhado, criando-o se necessário."""
+        if cls._http_client is None:
+            cls._http_client = httpx.AsyncClient(
+                headers=cls.HEADERS,
+                timeout=SEARCH_FETCH_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=SEARCH_MAX_CONNECTIONS, max_keepalive_connections=SEARCH_MAX_CONNECTIONS)
+            )
+        return cls._http_client
+    
+    @classmethod
+    def _get_search_executor(cls):
+        """Retorna o executor exclusivo das consultas ao Google, criando-o se necessário."""
+        if cls._search_executor is None:
+            cls._search_executor = ThreadPoolExecutor(max_workers=cls.SEARCH_THREADS, thread_name_prefix="pesquisa-google")
+        return cls._search_executor
+    
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def _host_slot(cls, url):
+        """Limita as requisições simultâneas para o host da URL.
+        
+        O semáforo do host é descartado quando não há mais requisições para ele.
+        """
+        host = urlparse(url).netloc.lower()
+        entry = cls._host_semaphores.setdefault(host, [asyncio.Semaphore(SEARCH_PER_HOST_LIMIT), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del cls._host_semaphores[host]
+    
+    @classmethod
+    async def close(cls):
+        """Fecha o cliente HTTP compartilhado e salva o cache de páginas."""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+        if cls._search_executor is not None:
+            cls._search_executor.shutdown(wait=False, cancel_futures=True)
+            cls._search_executor = None
+        await cls._page_cache.save()
+    
+    @staticmethod
+    def _extract_content(html):
+        """Extrai título e resumo do HTML de uma página."""
+        # Parseando o HTML
+        BeautifulSoup = COMPONENTS.module("bs4", "BeautifulSoup")
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Obtendo o título
+        title = soup.title.string if soup.title else "Sem título"
+        
+        # Obtendo um resumo do conteúdo (primeiros parágrafos)
+        paragraphs = soup.find_all('p')
+        content = ""
+        for p in paragraphs[:5]:  # Pegando os 5 primeiros parágrafos
+            if p.text and len(p.text.strip()) > 20:  # Evitando parágrafos vazios ou muito curtos
+                content += p.text.strip() + " "
+        
+        if not content:
+            return None
+        
+        # Limpando o conteúdo (removendo caracteres especiais e formatação)
+        content = re.sub(r'\s+', ' ', content)  # Substituindo múltiplos espaços por um único
+        content = re.sub(r'[^\w\s.,;:!?()-]', '', content)  # Removendo caracteres especiais
+        
+        # Limitando o tamanho do conteúdo
+        content = content[:500] + "..." if len(content) > 500 else content
+        
+        return title, content
+    
+    @staticmethod
+    def _page_result(url, entry):
+        """Monta o resultado da pesquisa a partir de uma entrada do cache de páginas."""
+        if not entry["content"]:
+            return None
+        return {
+            "title": entry["title"],
+            "url": url,
+            "content": entry["content"]
+        }
+    
+    @classmethod
+    async def _fetch_result(cls, url):
+        """Baixa uma página e extrai seu conteúdo, respeitando o limite por host."""
+        try:
+            # Entrada fresca no cache: nenhuma requisição
+            entry = cls._page_cache.get(url)
+            if entry and cls._page_cache.is_fresh(entry):
+                return cls._page_result(url, entry)
+            
+            # Entrada antiga: requisição condicional
+            headers = {}
+            if entry:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+            
+            async with cls._host_slot(url):
+                response = await cls._get_http_client().get(url, headers=headers)
+            
+            if response.status_code == 304 and entry:
+                cls._page_cache.touch(url)
+                return cls._page_result(url, entry)
+            
+            if response.status_code != 200:
+                return None
+            
+            # O parsing roda em outra thread para não travar o event loop
+            extracted = await asyncio.to_thread(cls._extract_content, response.text)
+            title, content = extracted if extracted else (None, None)
+            
+            # Páginas sem conteúdo útil também são guardadas para evitar novo parsing
+            cls._page_cache.set(
+                url, title, content,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified")
+            )
+            if cls._page_cache.needs_save():
+                await cls._page_cache.save()
+            
+            return cls._page_result(url, cls._page_cache.get(url))
+        
+        except httpx.HTTPError as e:
+            logger.warning(f"Erro ao acessar URL {url}: {str(e)}")
+        except Exception as e:
+            logger.warning(f"Erro ao processar URL {url}: {str(e)}")
+        return None
+
+    @classmethod
+    async def search_google(cls, query, num_results=5):
+        """Realiza uma pesquisa no Google e retorna os resultados, usando o cache quando possível."""
+        normalized_query = cls.normalize_query(query)
+        cache_key = f"{num_results}:{normalized_query}"
+        
+        cached_results = cls._results_cache.get(cache_key)
+        if cached_results is not None:
+            logger.info(f"Resultados da pesquisa encontrados no cache para: {query}")
+            return cached_results
+        
+        # Reaproveitando uma pesquisa idêntica que já está em andamento
+        if cache_key in cls._pending_searches:
+            return await asyncio.shield(cls._pending_searches[cache_key])
+        
+        task = asyncio.create_task(cls._search_google(query, num_results))
+        cls._pending_searches[cache_key] = task
+        try:
+            results = await asyncio.shield(task)
+        finally:
+            cls._pending_searches.pop(cache_key, None)
+        
+        # Resultados vazios não são armazenados (podem ser falhas temporárias)
+        if results:
+            cls._results_cache.set(cache_key, results, ttl=cls._cache_ttl(normalized_query))
+        return results
+    
+    @classmethod
+    @TIMINGS.timed("pesquisa web")
+    async def _search_google(cls, query, num_results=5):
+        """Executa a pesquisa no Google e baixa as páginas encontradas."""
+        try:
+            logger.info(f"Realizando pesquisa no Google para: {query}")
+            
+            # Um único prazo para a consulta e para o download das páginas
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + SEARCH_DEADLINE
+            
+            # Realizando a pesquisa (biblioteca síncrona, executada em outra thread). O googlesearch-python
+            # repete a consulta enquanto a página do Google não traz resultados reconhecíveis (ex.: página
+            # de consentimento), por isso a espera pela lista de URLs também tem prazo
+            search = COMPONENTS.module("googlesearch", "search")
+            request_timeout = min(SEARCH_FETCH_TIMEOUT, SEARCH_DEADLINE)
+            try:
+                search_urls = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        cls._get_search_executor(),
+                        lambda: list(search(query, num_results=num_results, lang="pt", timeout=request_timeout))
+                    ),
+                    timeout=SEARCH_DEADLINE
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Prazo esgotado ao consultar o Google para: {query}")
+                return []
+            
+            if not search_urls:
+                logger.warning("Nenhum resultado encontrado na pesquisa.")
+                return []
+            
+            # Ignorando URLs problemáticas comuns
+            urls = [url for url in search_urls if not any(blocked in url.lower() for blocked in cls.BLOCKED_DOMAINS)]
+            
+            # Baixando as páginas em paralelo, com o tempo que resta do prazo
+            remaining = deadline - loop.time()
+            if not urls:
+                return []
+            if remaining <= 0:
+                logger.info("Prazo da pesquisa esgotado antes do download das páginas.")
+                return []
+            tasks = [asyncio.create_task(cls._fetch_result(url)) for url in urls]
+            
+            done, pending = await asyncio.wait(tasks, timeout=remaining)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.info(f"Prazo da pesquisa esgotado: {len(pending)} páginas descartadas.")
+            
+            # Mantendo a ordem original dos resultados do Google
+            search_results = [task.result() for task in tasks if task in done and task.result()]
+            
+            logger.info(f"Pesquisa concluída. Encontrados {len(search_results)} resultados.")
+            return search_results
+        
+        except Exception as e:
+            logger.error(f"Erro na pesquisa Google: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return []
+    
+    @staticmethod
+    def format_search_results(results):
+        """Formata os resultados da pesquisa para uso no prompt."""
+        if not results:
+            return "Não foi possível encontrar resultados relevantes para esta pesquisa."
+        
+        formatted_results = "Resultados da pesquisa na web:\n\n"
+        
+        for i, result in enumerate(results, 1):
+            formatted_results += f"{i}. {result['title']}\n"
+            formatted_results += f"URL: {result['url']}\n"
+            formatted_results += f"Resumo: {result['content']}\n\n"
+        
+        return formatted_results
+
+class SemanticCache:
+    """Índice de perguntas semelhantes: MinHash/LSH sobre shingles de caracteres, em memória."""
+    
+    # 20 bandas de 3 linhas: o joelho da curva S fica em ~0.37, então pares com
+    # similaridade 0.6 viram candidatos em ~99% dos casos (8x4 ficava em ~67%)
+    NUM_BANDS = 20
+    ROWS_PER_BAND = 3
+    SHINGLE_SIZE = 3
+    _PRIME = (1 << 61) - 1
+    
+    # Termos que mudam a resposta: perguntas que diferem em algum deles nunca são equivalentes
+    DISTINCTIVE_TERMS = {
+        "cdb", "lci", "lca", "cri", "cra", "cdi", "ipca", "igpm", "selic", "pib", "poupanca",
+        "tesouro", "prefixado", "debentures", "fii", "fiis", "etf", "etfs", "bdr", "bdrs",
+        "acao", "acoes", "fundo", "fundos", "bitcoin", "ethereum", "cripto", "criptomoedas",
+        "dolar", "euro", "ouro", "ibovespa", "inss", "fgts", "irpf", "ir", "previdencia",
+        "pgbl", "vgbl", "imovel", "imoveis", "fixa", "variavel", "compra", "venda", "comprar", "vender"
+    }
+    # Negações invertem o sentido da pergunta
+    NEGATIONS = {"nao", "nunca", "nem", "sem", "jamais", "nenhum", "nenhuma", "ninguem"}
+    
+    def __init__(self, threshold=0.6, max_entries=5000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        rng = random.Random(1234)
+        self._permutations = [
+            (rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME))
+            for _ in range(self.NUM_BANDS * self.ROWS_PER_BAND)
+        ]
+        self._entries = OrderedDict()  # chave -> (escopo, tokens, shingles, bandas)
+        self._buckets = {}  # (escopo, banda, valores) -> chaves
+        self.hits = 0
+        self.misses = 0
+    
+    def _features(self, question):
+        """Tokens normalizados, shingles de caracteres e bandas LSH de uma pergunta."""
+        tokens = set(GoogleSearch.normalize_query(question).split())
+        text = f" {' '.join(sorted(tokens))} "
+        shingles = {text[i:i + self.SHINGLE_SIZE] for i in range(max(len(text) - self.SHINGLE_SIZE + 1, 1))}
+        
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        signature = [min((a * h + b) % self._PRIME for h in hashes) for a, b in self._permutations]
+        bands = [
+            tuple(signature[i * self.ROWS_PER_BAND:(i + 1) * self.ROWS_PER_BAND])
+            for i in range(self.NUM_BANDS)
+        ]
+        return tokens, shingles, bands
+    
+    @classmethod
+    def _distinctive(cls, tokens):
+        """Tokens que mudam a resposta: produtos, negações e qualquer número (valores, anos, prazos, %)."""
+        return {
+            token for token in tokens
+            if token in cls.DISTINCTIVE_TERMS or token in cls.NEGATIONS or any(ch.isdigit() for ch in token)
+        }
+    
+    def add(self, scope, key, question):
+        """Indexa uma pergunta em cache."""
+        if key in self._entries:
+            self.remove(key)
+        
+        tokens, shingles, bands = self._features(question)
+        self._entries[key] = (scope, tokens, shingles, bands)
+        for band_index, band in enumerate(bands):
+            self._buckets.setdefault((scope, band_index, band), set()).add(key)
+        
+        while len(self._entries) > self.max_entries:
+            self.remove(next(iter(self._entries)))
+    
+    def remove(self, key):
+        """Remove uma pergunta do índice."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        
+        scope, _, _, bands = entry
+        for band_index, band in enumerate(bands):
+            bucket_key = (scope, band_index, band)
+            bucket = self._buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[bucket_key]
+    
+    def find(self, scope, question):
+        """Retorna a chave da pergunta indexada mais parecida no mesmo escopo, ou None."""
+        tokens, shingles, bands = self._features(question)
+        
+        # Candidatos: perguntas que coincidem em ao menos uma banda
+        candidates = set()
+        for band_index, band in enumerate(bands):
+            candidates.update(self._buckets.get((scope, band_index, band), ()))
+        
+        best_key, best_similarity = None, self.threshold
+        for key in candidates:
+            _, other_tokens, other_shingles, _ = self._entries[key]
+            if self._distinctive(tokens ^ other_tokens):
+                continue
+            similarity = len(shingles & other_shingles) / len(shingles | other_shingles)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        
+        if best_key is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+        return best_key
+
+class UserMemory:
+    """Classe para gerenciar a memória de interações com usuários."""
+    
+    # Listas que crescem a cada interação: vão para o journal como acréscimos
+    HISTORY_LIMITS = {"conversation_history": 15, "sentiment_history": 20}
+    # Campos do perfil regravados no journal a cada interação
+    INTERACTION_FIELDS = (
+        "first_interaction", "last_interaction", "interaction_count", "topics", "detected_region",
+        "detected_expertise", "conversation_style", "personality_compatibility", "long_term_memory",
+        "session_data"
+    )
+    
+    def __init__(self):
+        self.user_data = {}
+        self.memory_file = "user_memory.json"
+        # Journal append-only com o estado de cada usuário alterado (uma linha JSON por atualização)
+        self.journal_file = "user_memory.journal"
+        self.compacting_file = "user_memory.journal.compacting"
+        self.journal_entries = 0
+        self._journal = None
+        self._compaction_thread = None
+        # As gravações no journal são feitas por uma thread própria, fora do event loop
+        self._journal_queue = queue.Queue()  # listas de linhas a gravar (None encerra a thread)
+        self._journal_thread = None
+        # Usuários alterados e entradas do journal ainda não gravadas (modo write-behind)
+        self.write_behind = USER_MEMORY_WRITE_BEHIND
+        self.dirty_users = set()
+        self.pending_lines = []
+        self.load_memory()
+        if self.write_behind:
+            # close grava as pendências e espera a thread do journal terminar
+            atexit.register(self.close)
+        self.text_analyzer = TextAnalyzer()
+    
+    def load_memory(self):
+        """Carrega o snapshot de usuários e reaplica o journal."""
+        try:
+            if os.path.exists(self.memory_file):
+                with open(self.memory_file, 'r', encoding='utf-8') as f:
+                    self.user_data = json.load(f)
+                logger.info(f"Memória de usuários carregada: {len(self.user_data)} usuários")
+            else:
+                logger.info("Arquivo de memória não encontrado. Criando nova memória.")
+            
+            # Um journal em compactação só existe se o processo parou no meio da compactação
+            self._replay_journal(self.compacting_file, self.user_data)
+            self.journal_entries = self._replay_journal(self.journal_file, self.user_data)
+            if self.journal_entries:
+                logger.info(f"Journal da memória reaplicado: {self.journal_entries} atualizações")
+        except Exception as e:
+            logger.error(f"Erro ao carregar memória: {str(e)}")
+    
+    @classmethod
+    def _replay_journal(cls, journal_file, user_data):
+        """Aplica as entradas de um journal sobre os dados informados.
+        
+        Cada entrada traz o registro completo do usuário ("data") ou apenas o que mudou
+        em uma interação: campos regravados ("set") e itens acrescentados às listas ("append").
+        """
+        if not os.path.exists(journal_file):
+            return 0
+        
+        entries = 0
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Linha incompleta (queda durante a escrita): ignorando
+                    continue
+                if "data" in entry:
+                    user_data[entry["user_id"]] = entry["data"]
+                else:
+                    record = user_data.setdefault(entry["user_id"], {})
+                    record.update(entry.get("set", {}))
+                    for key, items in entry.get("append", {}).items():
+                        record[key] = (record.get(key, []) + items)[-cls.HISTORY_LIMITS[key]:]
+                entries += 1
+        return entries
+    
+    def _journal_line(self, user_id_str, changes=None):
+        """Serializa uma entrada do journal: as alterações informadas ou o registro completo."""
+        entry = {"user_id": user_id_str}
+        if changes is not None:
+            entry.update(changes)
+        else:
+            entry["data"] = self.user_data[user_id_str]
+        return json.dumps(entry, ensure_ascii=False) + "\n"
+    
+    def _persist_user(self, user_id_str, changes=None):
+        """Persiste as alterações de um usuário (ou as adia no modo write-behind)."""
+        line = self._journal_line(user_id_str, changes)
+        if not self.write_behind:
+            self._append_journal([line])
+            return
+        
+        self.pending_lines.append(line)
+        self.dirty_users.add(user_id_str)
+        if len(self.dirty_users) >= USER_MEMORY_FLUSH_THRESHOLD:
+            self.flush()
+    
+    def flush(self):
+        """Envia de uma vez à thread do journal as alterações acumuladas desde o último envio.
+        
+        As entradas já estão serializadas e a escrita acontece na thread do journal, na ordem
+        de envio; por isso a chamada não bloqueia o event loop nem disputa com o flush final.
+        """
+        if not self.pending_lines:
+            return
+        lines, self.pending_lines = self.pending_lines, []
+        user_count = len(self.dirty_users)
+        self.dirty_users.clear()
+        self._append_journal(lines)
+        logger.debug(f"Memória de usuários: {user_count} usuários gravados em lote")
+    
+    async def run_write_behind(self):
+        """Envia periodicamente as alterações acumuladas para gravação."""
+        while True:
+            await asyncio.sleep(USER_MEMORY_FLUSH_INTERVAL)
+            self.flush()
+    
+    def _append_journal(self, lines):
+        """Entrega linhas já serializadas à thread que grava o journal."""
+        if self._journal_thread is None or not self._journal_thread.is_alive():
+            self._journal_thread = threading.Thread(target=self._journal_writer, name="user-memory-journal", daemon=True)
+            self._journal_thread.start()
+        self._journal_queue.put(lines)
+    
+    def _journal_writer(self):
+        """Grava no journal as linhas recebidas, juntando em uma escrita o que chegar de uma vez."""
+        while True:
+            batch = [self._journal_queue.get()]
+            while True:
+                try:
+                    batch.append(self._journal_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = [line for item in batch if item is not None for line in item]
+                if lines:
+                    self._write_journal(lines)
+            finally:
+                for _ in batch:
+                    self._journal_queue.task_done()
+            if None in batch:
+                return
+    
+    def _stop_journal_writer(self):
+        """Aguarda a gravação das linhas pendentes e encerra a thread do journal."""
+        if self._journal_thread is not None and self._journal_thread.is_alive():
+            self._journal_queue.put(None)
+            self._journal_thread.join()
+        self._journal_thread = None
+    
+    def _write_journal(self, lines):
+        """Acrescenta as linhas ao journal (executado na thread do journal)."""
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_file, 'a', encoding='utf-8')
+            self._journal.write("".join(lines))
+            self._journal.flush()
+            self.journal_entries += len(lines)
+        except Exception as e:
+            logger.error(f"Erro ao gravar journal da memória: {str(e)}")
+            return
+        
+        if self.journal_entries >= USER_MEMORY_COMPACT_EVERY:
+            self.compact_in_background()
+    
+    def compact_in_background(self):
+        """Rotaciona o journal e compacta as entradas no snapshot em outra thread."""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        try:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self.journal_file):
+                if os.path.exists(self.compacting_file):
+                    # Mantendo a ordem: entradas antigas primeiro
+                    with open(self.journal_file, 'r', encoding='utf-8') as src, \
+                            open(self.compacting_file, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.compacting_file)
+            self.journal_entries = 0
+        except Exception as e:
+            logger.error(f"Erro ao rotacionar journal da memória: {str(e)}")
+            return
+        
+        self._compaction_thread = threading.Thread(target=self._compact, name="user-memory-compaction", daemon=True)
+        self._compaction_thread.start()
+    
+    def _compact(self):
+        """Incorpora o journal rotacionado ao snapshot (executado fora do event loop)."""
+        try:
+            snapshot = {}
+            if os.path.exists(self.memory_file):
+                with open(self.memory_file, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            self._replay_journal(self.compacting_file, snapshot)
+            
+            temp_file = f"{self.memory_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.memory_file)
+            os.remove(self.compacting_file)
+            logger.info(f"Memória de usuários compactada: {len(snapshot)} usuários")
+        except Exception as e:
+            logger.error(f"Erro ao compactar memória: {str(e)}")
+    
+    def save_memory(self):
+        """Salva a memória completa de usuários no snapshot e descarta o journal."""
+        try:
+            self._stop_journal_writer()
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                self._compaction_thread.join()
+            temp_file = f"{self.memory_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.user_data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.memory_file)
+            
+            # O snapshot já contém todas as atualizações, inclusive as pendentes
+            self.dirty_users.clear()
+            self.pending_lines = []
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            for journal_file in (self.journal_file, self.compacting_file):
+                if os.path.exists(journal_file):
+                    os.remove(journal_file)
+            self.journal_entries = 0
+            logger.info("Memória de usuários salva com sucesso")
+        except Exception as e:
+            logger.error(f"Erro ao salvar memória: {str(e)}")
+    
+    def close(self):
+        """Grava as alterações pendentes, aguarda a compactação em andamento e fecha o journal."""
+        self.flush()
+        self._stop_journal_writer()
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            self._compaction_thread.join()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def get_user_info(self, user_id):
+        """Obtém informações sobre um usuário específico."""
+        user_id_str = str(user_id)
+        if user_id_str not in self.user_data:
+            self.user_data[user_id_str] = self._new_user_record()
+        return self.user_data[user_id_str]
+    
+    @staticmethod
+    def _new_user_record():
+        """Cria o registro inicial de um usuário."""
+        current_time = datetime.now().isoformat()
+        return {
+            "first_interaction": current_time,
+            "last_interaction": current_time,
+            "interaction_count": 0,
+            "topics": [],
+            "detected_region": None,
+            "detected_expertise": "iniciante",  # iniciante, intermediário, avançado
+            "sentiment_history": [],  # histórico de sentimentos detectados
+            "conversation_style": "default",  # estilo de conversa preferido
+            "conversation_history": [],
+            "personality_compatibility": {  # compatibilidade com cada personalidade
+                "default": 0,
+                "technical": 0,
+                "friendly": 0,
+                "mentor": 0
+            },
+            "long_term_memory": {  # memória de longo prazo
+                "personal_details": {},
+                "preferences": {},
+                "important_dates": {},
+                "significant_topics": [],
+                "key_questions": []
+            },
+            "session_data": {  # dados da sessão atual
+                "session_start": current_time,
+                "queries_this_session": 0,
+                "current_topic": None,
+                "topic_continuity": False,
+                "last_sentiment": "neutro"
+            }
+        }
+    
+    def update_user_interaction(self, user_id, user_message, bot_response, analysis=None):
         """Atualiza as informações de interação de um usuário de forma mais completa."""
         user_id_str = str(user_id)
         user_info = self.get_user_info(user_id)
@@ -651,17 +2063,20 @@ class UserMemory:
         user_info["last_interaction"] = current_time
         user_info["interaction_count"] += 1
         
-        # Analisando a mensagem do usuário
-        sentiment = self.text_analyzer.analyze_sentiment(user_message)
-        topics = self.text_analyzer.extract_topics(user_message)
-        question_complexity = self.text_analyzer.detect_question_complexity(user_message)
-        detected_region = self.text_analyzer.detect_user_region(user_message)
+        # Analisando a mensagem do usuário (reaproveitando a análise já feita, se houver)
+        if analysis is None:
+            analysis = self.text_analyzer.analyze_message(user_message)
+        sentiment = analysis.sentiment
+        topics = list(analysis.topics)
+        question_complexity = analysis.question_complexity
+        detected_region = analysis.region
         
         # Atualizando sentimento
-        user_info["sentiment_history"].append({
+        sentiment_entry = {
             "timestamp": current_time,
             "sentiment": sentiment
-        })
+        }
+        user_info["sentiment_history"].append(sentiment_entry)
         
         # Mantendo apenas os 20 últimos sentimentos
         if len(user_info["sentiment_history"]) > 20:
@@ -684,14 +2099,15 @@ class UserMemory:
                 user_info["session_data"]["current_topic"] = topics[0]
         
         # Adicionando ao histórico de conversas (limitando a 15 interações)
-        user_info["conversation_history"].append({
+        turn = {
             "timestamp": current_time,
             "user_message": user_message,
             "bot_response": bot_response,
             "sentiment": sentiment,
             "topics": topics,
             "complexity": question_complexity
-        })
+        }
+        user_info["conversation_history"].append(turn)
         
         # Mantendo apenas as 15 últimas interações
         if len(user_info["conversation_history"]) > 15:
@@ -723,16 +2139,10 @@ class UserMemory:
         # Extrair possíveis preferências ou detalhes pessoais de mensagens longas
         if len(user_message.split()) > 15:
             # Procurando por preferências comuns em finanças
-            preferences_keywords = {
-                "risco": ["conservador", "moderado", "arrojado", "agressivo", "cauteloso"],
-                "horizonte": ["curto prazo", "médio prazo", "longo prazo"],
-                "objetivo": ["aposentadoria", "casa própria", "viagem", "educação", "independência"]
-            }
-            
-            for category, keywords in preferences_keywords.items():
-                for keyword in keywords:
-                    if keyword in user_message.lower():
-                        user_info["long_term_memory"]["preferences"][category] = keyword
+            hits = KEYWORDS.scan(user_message)
+            for category in hits.categories("preferences"):
+                # A última palavra encontrada, na ordem da tabela, prevalece
+                user_info["long_term_memory"]["preferences"][category] = hits.ordered("preferences", category)[-1]
             
             # Procurando por detalhes pessoais
             personal_details_patterns = [
@@ -770,9 +2180,12 @@ class UserMemory:
         if max_personalities:
             user_info["conversation_style"] = max_personalities[0]
         
-        # Salvando as alterações
+        # Registrando a alteração: campos do perfil e o novo turno, sem o histórico completo
         self.user_data[user_id_str] = user_info
-        self.save_memory()
+        self._persist_user(user_id_str, {
+            "set": {key: user_info[key] for key in self.INTERACTION_FIELDS},
+            "append": {"sentiment_history": [sentiment_entry], "conversation_history": [turn]}
+        })
         
         return user_info
     
@@ -897,7 +2310,7 @@ class UserMemory:
         
         return context
     
-    def detect_intent_change(self, user_id, current_message):
+    def detect_intent_change(self, user_id, current_message, analysis=None):
         """Detecta se houve mudança significativa de intenção ou tópico."""
         user_info = self.get_user_info(user_id)
         
@@ -905,7 +2318,7 @@ class UserMemory:
             return True  # Primeira mensagem sempre é uma nova intenção
         
         # Extraindo tópicos da mensagem atual
-        current_topics = self.text_analyzer.extract_topics(current_message)
+        current_topics = analysis.topics if analysis is not None else self.text_analyzer.extract_topics(current_message)
         
         # Obtendo tópicos da última mensagem
         last_interaction = user_info["conversation_history"][-1]
@@ -927,12 +2340,216 @@ class UserMemory:
             return True
         
         # Verificando palavras-chave de transição
-        transition_keywords = ["outra", "diferente", "novo", "mudar", "outro assunto", "falando em"]
-        if any(keyword in current_message.lower() for keyword in transition_keywords):
+        keywords = analysis.keywords if analysis is not None else KEYWORDS.scan(current_message)
+        if keywords.any("transition", "transition"):
             return True
         
         return False
 
+class SQLiteUserMemory(UserMemory):
+    """Memória de usuários em SQLite, com usuários e turnos de conversa em tabelas separadas.
+    
+    As gravações usam a mesma thread de escrita do journal em JSON, com uma conexão
+    própria; a conexão principal, usada no event loop, só faz leituras.
+    """
+    
+    HISTORY_LIMIT = 15  # turnos carregados por usuário, como no armazenamento em JSON
+    
+    def __init__(self, db_file=SQLITE_DB_FILE, cache_size=SQLITE_USER_CACHE_SIZE):
+        self.db_file = db_file
+        self.cache_size = cache_size
+        # Arquivos do armazenamento em JSON, importados na primeira execução
+        self.memory_file = "user_memory.json"
+        self.journal_file = "user_memory.journal"
+        self.compacting_file = "user_memory.journal.compacting"
+        # Apenas os usuários ativos ficam em memória (LRU)
+        self.user_data = OrderedDict()
+        # Cada interação já é uma transação curta no banco
+        self.write_behind = False
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._writer_conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._writer_conn.execute("PRAGMA synchronous=NORMAL")
+        self._journal_queue = queue.Queue()
+        self._journal_thread = None
+        self._unwritten = {}  # usuário -> gravações ainda na fila
+        self._unwritten_lock = threading.Lock()
+        self._create_schema()
+        self.load_memory()
+        self.text_analyzer = TextAnalyzer()
+    
+    def _create_schema(self):
+        """Cria as tabelas e índices, se necessário."""
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    first_interaction TEXT,
+                    last_interaction TEXT,
+                    interaction_count INTEGER NOT NULL DEFAULT 0,
+                    data TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    user_message TEXT,
+                    bot_response TEXT,
+                    sentiment TEXT,
+                    topics TEXT,
+                    complexity TEXT
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_users_last_interaction ON users (last_interaction)")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_turns_user_timestamp ON conversation_turns (user_id, timestamp)"
+            )
+    
+    def load_memory(self):
+        """Importa a memória em JSON (snapshot e journal) se o banco ainda estiver vazio."""
+        try:
+            user_count = self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            logger.info(f"Banco SQLite de usuários aberto: {user_count} usuários")
+            if user_count > 0:
+                return
+            
+            # Mesmo caminho de carga do armazenamento em JSON: snapshot e journal reaplicado
+            legacy_data = {}
+            if os.path.exists(self.memory_file):
+                with open(self.memory_file, 'r', encoding='utf-8') as f:
+                    legacy_data = json.load(f)
+            self._replay_journal(self.compacting_file, legacy_data)
+            self._replay_journal(self.journal_file, legacy_data)
+            if legacy_data:
+                self._write_rows(self.conn, [
+                    self._user_rows(user_id_str, user_info, all_turns=True)
+                    for user_id_str, user_info in legacy_data.items()
+                ])
+                logger.info(f"Memória em JSON importada para o SQLite: {len(legacy_data)} usuários")
+        except Exception as e:
+            logger.error(f"Erro ao carregar memória SQLite: {str(e)}")
+    
+    def save_memory(self):
+        """Os dados são gravados a cada interação; apenas aguarda as gravações pendentes."""
+        self._journal_queue.join()
+    
+    def close(self):
+        """Aguarda as gravações pendentes e fecha as conexões com o banco."""
+        self._stop_journal_writer()
+        self._writer_conn.close()
+        self.conn.close()
+    
+    def _load_user(self, user_id_str):
+        """Carrega um usuário e seus turnos mais recentes do banco."""
+        row = self.conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id_str,)).fetchone()
+        if not row:
+            return None
+        
+        user_info = json.loads(row[0])
+        turns = self.conn.execute(
+            "SELECT timestamp, user_message, bot_response, sentiment, topics, complexity "
+            "FROM conversation_turns WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (user_id_str, self.HISTORY_LIMIT)
+        ).fetchall()
+        user_info["conversation_history"] = [
+            {
+                "timestamp": timestamp,
+                "user_message": user_message,
+                "bot_response": bot_response,
+                "sentiment": sentiment,
+                "topics": json.loads(topics) if topics else [],
+                "complexity": complexity
+            }
+            for timestamp, user_message, bot_response, sentiment, topics, complexity in reversed(turns)
+        ]
+        return user_info
+    
+    def get_user_info(self, user_id):
+        """Obtém informações sobre um usuário específico."""
+        user_id_str = str(user_id)
+        user_info = self.user_data.get(user_id_str)
+        if user_info is not None:
+            self.user_data.move_to_end(user_id_str)
+            return user_info
+        
+        # Usuário saiu do cache com gravações ainda na fila: o banco estaria desatualizado
+        with self._unwritten_lock:
+            unwritten = user_id_str in self._unwritten
+        if unwritten:
+            self._journal_queue.join()
+        
+        user_info = self._load_user(user_id_str) or self._new_user_record()
+        self.user_data[user_id_str] = user_info
+        while len(self.user_data) > self.cache_size:
+            self.user_data.popitem(last=False)
+        return user_info
+    
+    def _persist_user(self, user_id_str, changes=None):
+        """Envia à thread de escrita o perfil do usuário e o turno de conversa mais recente."""
+        # A serialização acontece aqui: o registro continua sendo alterado no event loop
+        rows = self._user_rows(user_id_str, self.user_data[user_id_str])
+        with self._unwritten_lock:
+            self._unwritten[user_id_str] = self._unwritten.get(user_id_str, 0) + 1
+        self._append_journal([rows])
+    
+    def _write_journal(self, items):
+        """Grava um lote de usuários em uma única transação (executado na thread de escrita)."""
+        self._write_rows(self._writer_conn, items)
+        with self._unwritten_lock:
+            for user_id_str, _, _ in items:
+                self._unwritten[user_id_str] -= 1
+                if self._unwritten[user_id_str] == 0:
+                    del self._unwritten[user_id_str]
+    
+    def _user_rows(self, user_id_str, user_info, all_turns=False):
+        """Monta as linhas do perfil e dos turnos de conversa (todos ou apenas o último)."""
+        profile = {key: value for key, value in user_info.items() if key != "conversation_history"}
+        history = user_info.get("conversation_history", [])
+        turns = history if all_turns else history[-1:]
+        user_row = (
+            user_id_str,
+            user_info.get("first_interaction"),
+            user_info.get("last_interaction"),
+            user_info.get("interaction_count", 0),
+            json.dumps(profile, ensure_ascii=False)
+        )
+        turn_rows = [
+            (
+                user_id_str,
+                turn["timestamp"],
+                turn.get("user_message"),
+                turn.get("bot_response"),
+                turn.get("sentiment"),
+                json.dumps(turn.get("topics", []), ensure_ascii=False),
+                turn.get("complexity")
+            )
+            for turn in turns
+        ]
+        return user_id_str, user_row, turn_rows
+    
+    @staticmethod
+    def _write_rows(conn, items):
+        """Grava perfis e turnos em uma transação."""
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, first_interaction, last_interaction, interaction_count, data) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET last_interaction = excluded.last_interaction, "
+                    "interaction_count = excluded.interaction_count, data = excluded.data",
+                    [user_row for _, user_row, _ in items]
+                )
+                conn.executemany(
+                    "INSERT INTO conversation_turns (user_id, timestamp, user_message, bot_response, sentiment, topics, complexity) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [turn_row for _, _, turn_rows in items for turn_row in turn_rows]
+                )
+        except Exception as e:
+            logger.error(f"Erro ao salvar usuário no SQLite: {str(e)}")
+
 class MongoDBStorage:
     """Classe para gerenciar o armazenamento de dados no MongoDB."""
     
@@ -942,16 +2559,27 @@ class MongoDBStorage:
         self.db = None
         self.users_collection = None
         self.mongodb_uri = os.getenv('MONGODB_URI')
+        self._init_bulk_queue()
+        self.user_cache = TTLCache(max_entries=MONGODB_USER_CACHE_SIZE, default_ttl=MONGODB_USER_CACHE_TTL)
         
         if self.mongodb_uri:
             try:
                 logger.info("Conectando ao MongoDB...")
-                self.client = MongoClient(self.mongodb_uri)
+                pymongo = COMPONENTS.module("pymongo")
+                self.client = pymongo.MongoClient(self.mongodb_uri, **self._client_options())
                 self.db = self.client.finance_bot
                 self.users_collection = self.db.users
                 # Criando índice para melhorar a performance das consultas
-                self.users_collection.create_index("user_id")
+                # (único, para que upserts simultâneos não dupliquem o usuário)
+                try:
+                    self.users_collection.create_index("user_id", unique=True)
+                except pymongo.errors.OperationFailure as e:
+                    logger.warning(f"Não foi possível criar índice único em user_id (documentos duplicados?): {str(e)}")
+                    self.users_collection.create_index("user_id")
                 logger.info("Conexão com MongoDB estabelecida com sucesso!")
+                if self.bulk_writes:
+                    self._bulk_thread = threading.Thread(target=self._run_bulk_writer, name="mongodb-bulk-writer", daemon=True)
+                    self._bulk_thread.start()
             except Exception as e:
                 logger.error(f"Erro ao conectar ao MongoDB: {str(e)}")
                 logger.error(f"Traceback: {traceback.format_exc()}")
@@ -963,6 +2591,217 @@ class MongoDBStorage:
         """Verifica se a conexão com o MongoDB está ativa."""
         return self.client is not None
     
+    @staticmethod
+    def _client_options():
+        """Opções de pool, timeouts e preferência de leitura do cliente."""
+        return {
+            "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+            "serverSelectionTimeoutMS": MONGODB_TIMEOUT_MS,
+            "connectTimeoutMS": MONGODB_TIMEOUT_MS,
+            "socketTimeoutMS": MONGODB_TIMEOUT_MS,
+            "readPreference": MONGODB_READ_PREFERENCE
+        }
+    
+    @staticmethod
+    def _new_user_doc(user_id_str):
+        """Documento padrão de um usuário ainda sem interações (não é gravado)."""
+        now = datetime.now()
+        return {
+            "user_id": user_id_str,
+            "first_interaction": now,
+            "last_interaction": now,
+            "interaction_count": 0,
+            "topics": [],
+            "preferences": {},
+            "conversation_history": []
+        }
+    
+    @staticmethod
+    def _interaction_update(user_message, bot_response, analysis=None):
+        """Monta o upsert que registra uma interação."""
+        now = datetime.now()
+        
+        # Criando nova interação
+        new_interaction = {
+            "timestamp": now,
+            "user_message": user_message,
+            "bot_response": bot_response
+        }
+        
+        # Identificando tópicos com base em palavras-chave
+        keywords = analysis.keywords if analysis is not None else KEYWORDS.scan(user_message)
+        new_topics = keywords.categories("interests")
+        
+        # Um único upsert: cria o documento se necessário e incrementa o contador no servidor,
+        # sem corrida entre atualizações simultâneas
+        return {
+            "$setOnInsert": {
+                "first_interaction": now,
+                "preferences": {}
+            },
+            "$set": {"last_interaction": now},
+            "$inc": {"interaction_count": 1},
+            "$push": {
+                "conversation_history": {
+                    "$each": [new_interaction],
+                    "$slice": -10  # Mantém apenas as 10 últimas interações
+                }
+            },
+            "$addToSet": {
+                "topics": {"$each": new_topics}
+            }
+        }
+    
+    def _cache_update(self, user_id_str, update):
+        """Aplica uma interação ao documento em cache (write-through), se existir."""
+        user_doc = self.user_cache.peek(user_id_str)
+        if user_doc is not None:
+            self._apply_update(user_doc, update)
+    
+    @staticmethod
+    def _apply_update(user_doc, update):
+        """Aplica ao documento uma interação (ou as interações combinadas de um usuário na fila)."""
+        user_doc["last_interaction"] = update["$set"]["last_interaction"]
+        user_doc["interaction_count"] = user_doc.get("interaction_count", 0) + update["$inc"]["interaction_count"]
+        history = user_doc.get("conversation_history", []) + update["$push"]["conversation_history"]["$each"]
+        user_doc["conversation_history"] = history[-10:]
+        topics = user_doc.setdefault("topics", [])
+        topics.extend(topic for topic in update["$addToSet"]["topics"]["$each"] if topic not in topics)
+    
+    @staticmethod
+    def _format_summary(user_doc):
+        """Formata o resumo das conversas recentes de um documento de usuário."""
+        if not user_doc or not user_doc.get("conversation_history"):
+            return "Não há histórico de conversas anteriores."
+        
+        summary = "Resumo das conversas recentes:\n\n"
+        
+        # Pegando as 3 últimas interações
+        recent_interactions = user_doc["conversation_history"][-3:]
+        
+        for i, interaction in enumerate(recent_interactions, 1):
+            timestamp = interaction["timestamp"].strftime("%d/%m/%Y %H:%M") if isinstance(interaction["timestamp"], datetime) else "Data desconhecida"
+            summary += f"Interação {i} ({timestamp}):\n"
+            summary += f"Usuário: {interaction['user_message']}\n"
+            summary += f"Bot: {interaction['bot_response'][:100]}...\n\n"
+        
+        summary += f"Tópicos de interesse: {', '.join(user_doc['topics']) if user_doc['topics'] else 'Nenhum identificado ainda'}\n"
+        summary += f"Total de interações: {user_doc['interaction_count']}"
+        
+        return summary
+    
+    def _init_bulk_queue(self):
+        """Inicializa a fila de interações pendentes de gravação em lote."""
+        self.bulk_writes = MONGODB_BULK_WRITES
+        self._pending_updates = OrderedDict()  # user_id -> update combinado
+        self._pending_count = 0  # interações na fila
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # um flush por vez (escritor em lote e backpressure)
+        # Usuários gravados em lote: o documento em cache pode ter sido lido antes da gravação
+        self._flushed_users = deque()
+        self._bulk_wakeup = threading.Event()
+        self._bulk_stopped = False
+        self._bulk_thread = None
+    
+    def _enqueue_update(self, user_id_str, update):
+        """Adiciona uma interação à fila, combinando-a com as pendentes do mesmo usuário."""
+        with self._pending_lock:
+            pending = self._pending_updates.get(user_id_str)
+            if pending is None:
+                self._pending_updates[user_id_str] = update
+            else:
+                # Mesmo usuário no lote: uma única operação com todas as interações, na ordem
+                pending["$set"] = update["$set"]
+                pending["$inc"]["interaction_count"] += update["$inc"]["interaction_count"]
+                pending["$push"]["conversation_history"]["$each"].extend(
+                    update["$push"]["conversation_history"]["$each"]
+                )
+                topics = pending["$addToSet"]["topics"]["$each"]
+                topics.extend(topic for topic in update["$addToSet"]["topics"]["$each"] if topic not in topics)
+            self._pending_count += 1
+            return self._pending_count
+    
+    def _take_batch(self):
+        """Retira da fila as operações de um lote, com os usuários correspondentes."""
+        UpdateOne = COMPONENTS.module("pymongo", "UpdateOne")
+        with self._pending_lock:
+            user_ids = []
+            batch = []
+            while self._pending_updates and len(batch) < MONGODB_BULK_BATCH_SIZE:
+                user_id_str, update = self._pending_updates.popitem(last=False)
+                user_ids.append(user_id_str)
+                batch.append(UpdateOne({"user_id": user_id_str}, update, upsert=True))
+                self._pending_count -= update["$inc"]["interaction_count"]
+            return user_ids, batch
+    
+    def _with_pending(self, user_id_str, user_doc):
+        """Aplica ao documento lido do banco as interações do usuário que ainda estão na fila."""
+        with self._pending_lock:
+            pending = self._pending_updates.get(user_id_str)
+            if pending is not None:
+                self._apply_update(user_doc, pending)
+        return user_doc
+    
+    def _drop_flushed_from_cache(self):
+        """Descarta do cache os usuários gravados em lote desde a última leitura (no event loop)."""
+        while self._flushed_users:
+            self.user_cache.discard(self._flushed_users.popleft())
+    
+    @staticmethod
+    def _duplicate_key_ops(batch, error):
+        """Separa as operações do lote que falharam por chave duplicada das demais falhas.
+        
+        Um upsert de um usuário novo falha com chave duplicada quando outro upsert do mesmo
+        usuário cria o documento ao mesmo tempo; repetido, ele encontra o documento e o atualiza.
+        """
+        write_errors = error.details.get("writeErrors", [])
+        duplicates = [batch[write_error["index"]] for write_error in write_errors if write_error.get("code") == 11000]
+        return duplicates, len(write_errors) - len(duplicates)
+    
+    def _write_batch(self, batch, retry_duplicates=True):
+        """Grava um lote, repetindo uma vez as operações que falharem por chave duplicada."""
+        pymongo = COMPONENTS.module("pymongo")
+        try:
+            self.users_collection.bulk_write(batch, ordered=False)
+            logger.debug(f"Lote de {len(batch)} usuários gravado no MongoDB")
+        except pymongo.errors.BulkWriteError as e:
+            duplicates, failed = self._duplicate_key_ops(batch, e)
+            if failed:
+                logger.error(f"Erro na gravação em lote no MongoDB ({failed} de {len(batch)} usuários): {str(e)}")
+            if duplicates and retry_duplicates:
+                logger.info(f"Repetindo {len(duplicates)} upserts que falharam por chave duplicada")
+                self._write_batch(duplicates, retry_duplicates=False)
+            elif duplicates:
+                logger.error(f"Upserts falharam novamente por chave duplicada ({len(duplicates)} usuários)")
+        except Exception as e:
+            logger.error(f"Erro na gravação em lote no MongoDB ({len(batch)} usuários): {str(e)}")
+    
+    def flush(self):
+        """Grava todas as interações pendentes em lotes não ordenados."""
+        with self._flush_lock:
+            while True:
+                user_ids, batch = self._take_batch()
+                if not batch:
+                    return
+                self._write_batch(batch)
+                self._flushed_users.extend(user_ids)
+    
+    def _run_bulk_writer(self):
+        """Grava a fila periodicamente ou quando um lote completo se forma (em outra thread)."""
+        while not self._bulk_stopped:
+            self._bulk_wakeup.wait(MONGODB_BULK_INTERVAL)
+            self._bulk_wakeup.clear()
+            self.flush()
+    
+    def close(self):
+        """Grava as interações pendentes e encerra a gravação em lote."""
+        self._bulk_stopped = True
+        self._bulk_wakeup.set()
+        if self._bulk_thread is not None:
+            self._bulk_thread.join()
+        if self.is_connected():
+            self.flush()
+    
     def get_user_info(self, user_id):
         """Obtém informações sobre um usuário específico."""
         user_id_str = str(user_id)
@@ -971,191 +2810,608 @@ class MongoDBStorage:
             logger.warning("MongoDB não está conectado. Não foi possível obter informações do usuário.")
             return None
         
-        user_doc = self.users_collection.find_one({"user_id": user_id_str})
-        
-        if not user_doc:
-            # Criando um novo documento para o usuário
-            user_doc = {
-                "user_id": user_id_str,
-                "first_interaction": datetime.now(),
-                "last_interaction": datetime.now(),
-                "interaction_count": 0,
-                "topics": [],
-                "preferences": {},
-                "conversation_history": []
-            }
-            self.users_collection.insert_one(user_doc)
-            logger.info(f"Novo usuário criado no MongoDB: {user_id_str}")
+        self._drop_flushed_from_cache()
+        user_doc = self.user_cache.get(user_id_str)
+        if user_doc is not None:
+            return user_doc
         
+        # Usuário ainda sem interações: o documento só é criado no primeiro upsert
+        user_doc = self.users_collection.find_one({"user_id": user_id_str}) or self._new_user_doc(user_id_str)
+        user_doc = self._with_pending(user_id_str, user_doc)
+        self.user_cache.set(user_id_str, user_doc)
         return user_doc
     
-    def update_user_interaction(self, user_id, user_message, bot_response):
-        """Atualiza as informações de interação de um usuário."""
+    def update_user_interaction(self, user_id, user_message, bot_response, analysis=None):
+        """Atualiza as informações de interação de um usuário com um único upsert atômico.
+        
+        Com a fila de gravação em lote cheia, retorna a gravação do atraso em outra thread
+        para quem chamou aguardar (call_storage aguarda resultados assíncronos).
+        """
         if not self.is_connected():
             logger.warning("MongoDB não está conectado. Não foi possível atualizar interação do usuário.")
             return
         
         user_id_str = str(user_id)
+        update = self._interaction_update(user_message, bot_response, analysis)
+        self._cache_update(user_id_str, update)
         
-        # Obtendo o documento do usuário
-        user_doc = self.get_user_info(user_id)
+        if self.bulk_writes:
+            pending_count = self._enqueue_update(user_id_str, update)
+            if pending_count >= MONGODB_BULK_MAX_PENDING:
+                # Fila cheia: quem chega aguarda a gravação do atraso (backpressure), fora do event loop
+                return asyncio.to_thread(self.flush)
+            elif len(self._pending_updates) >= MONGODB_BULK_BATCH_SIZE:
+                self._bulk_wakeup.set()
+            return
         
-        # Atualizando dados básicos
-        update_data = {
-            "last_interaction": datetime.now(),
-            "interaction_count": user_doc["interaction_count"] + 1
-        }
+        self.users_collection.update_one(
+            {"user_id": user_id_str},
+            update,
+            upsert=True
+        )
         
-        # Criando nova interação
-        new_interaction = {
-            "timestamp": datetime.now(),
-            "user_message": user_message,
-            "bot_response": bot_response
-        }
+        logger.debug(f"Interação do usuário {user_id_str} atualizada no MongoDB")
+    
+    def get_conversation_summary(self, user_id):
+        """Obtém um resumo das conversas recentes com o usuário."""
+        if not self.is_connected():
+            logger.warning("MongoDB não está conectado. Não foi possível obter resumo da conversa.")
+            return "Não foi possível acessar o histórico de conversas."
         
-        # Identificando tópicos com base em palavras-chave
-        topics_keywords = {
-            "investimentos": ["investir", "investimento", "ação", "ações", "bolsa"],
-            "renda_fixa": ["renda fixa", "cdb", "tesouro", "lci", "lca"],
-            "aposentadoria": ["aposentadoria", "previdência", "inss", "aposentar"],
-            "dívidas": ["dívida", "dívidas", "empréstimo", "crédito", "financiamento"],
-            "economia": ["economia", "poupar", "economizar", "gastos"],
-            "educação_financeira": ["educação financeira", "aprender", "finanças"],
-            "impostos": ["imposto", "impostos", "ir", "declaração"],
-            "imóveis": ["imóvel", "imóveis", "casa", "apartamento", "financiamento"]
-        }
+        return self._format_summary(self.get_user_info(user_id))
+
+class AsyncMongoDBStorage(MongoDBStorage):
+    """Armazenamento no MongoDB com o driver assíncrono (Motor), sem bloquear o event loop."""
+    
+    def __init__(self):
+        """Cria o cliente assíncrono; a conexão é estabelecida no primeiro uso."""
+        self.client = None
+        self.db = None
+        self.users_collection = None
+        self.mongodb_uri = os.getenv('MONGODB_URI')
+        self._indexes_ready = False
+        self._init_bulk_queue()
+        self.user_cache = TTLCache(max_entries=MONGODB_USER_CACHE_SIZE, default_ttl=MONGODB_USER_CACHE_TTL)
+        self._bulk_wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._bulk_task = None
         
-        new_topics = []
-        for topic, keywords in topics_keywords.items():
-            for keyword in keywords:
-                if keyword.lower() in user_message.lower() and topic not in user_doc["topics"]:
-                    new_topics.append(topic)
+        if self.mongodb_uri:
+            try:
+                logger.info("Configurando cliente assíncrono do MongoDB...")
+                AsyncIOMotorClient = COMPONENTS.module("motor.motor_asyncio", "AsyncIOMotorClient")
+                self.client = AsyncIOMotorClient(self.mongodb_uri, **self._client_options())
+                self.db = self.client.finance_bot
+                self.users_collection = self.db.users
+            except Exception as e:
+                logger.error(f"Erro ao configurar cliente assíncrono do MongoDB: {str(e)}")
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                self.client = None
+        else:
+            logger.info("URI do MongoDB não configurada. Usando armazenamento local.")
+    
+    async def connect(self):
+        """Confirma que o servidor responde, já que o Motor só conecta no primeiro uso.
         
-        # Atualizando o documento do usuário no MongoDB
-        self.users_collection.update_one(
+        Sem resposta dentro do serverSelectionTimeoutMS, o cliente é descartado e
+        is_connected passa a indicar a falha, como no armazenamento síncrono.
+        """
+        if self.client is None:
+            return False
+        pymongo = COMPONENTS.module("pymongo")
+        try:
+            await self.client.admin.command("ping")
+        except pymongo.errors.PyMongoError as e:
+            logger.error(f"Erro ao conectar ao MongoDB: {str(e)}")
+            self.client.close()
+            self.client = None
+            return False
+        logger.info("Conexão com MongoDB estabelecida com sucesso!")
+        await self._ensure_indexes()
+        return True
+    
+    async def _ensure_indexes(self):
+        """Cria o índice de user_id; em caso de falha, tenta de novo na próxima operação."""
+        if self._indexes_ready:
+            return
+        pymongo = COMPONENTS.module("pymongo")
+        try:
+            try:
+                await self.users_collection.create_index("user_id", unique=True)
+            except pymongo.errors.OperationFailure as e:
+                logger.warning(f"Não foi possível criar índice único em user_id (documentos duplicados?): {str(e)}")
+                await self.users_collection.create_index("user_id")
+        except pymongo.errors.PyMongoError as e:
+            logger.warning(f"Não foi possível criar índice em user_id: {str(e)}")
+            return
+        self._indexes_ready = True
+    
+    async def get_user_info(self, user_id):
+        """Obtém informações sobre um usuário específico."""
+        user_id_str = str(user_id)
+        
+        if not self.is_connected():
+            logger.warning("MongoDB não está conectado. Não foi possível obter informações do usuário.")
+            return None
+        
+        self._drop_flushed_from_cache()
+        user_doc = self.user_cache.get(user_id_str)
+        if user_doc is not None:
+            return user_doc
+        
+        await self._ensure_indexes()
+        user_doc = await self.users_collection.find_one({"user_id": user_id_str}) or self._new_user_doc(user_id_str)
+        user_doc = self._with_pending(user_id_str, user_doc)
+        self.user_cache.set(user_id_str, user_doc)
+        return user_doc
+    
+    async def update_user_interaction(self, user_id, user_message, bot_response, analysis=None):
+        """Atualiza as informações de interação de um usuário com um único upsert atômico."""
+        if not self.is_connected():
+            logger.warning("MongoDB não está conectado. Não foi possível atualizar interação do usuário.")
+            return
+        
+        user_id_str = str(user_id)
+        await self._ensure_indexes()
+        update = self._interaction_update(user_message, bot_response, analysis)
+        self._cache_update(user_id_str, update)
+        
+        if self.bulk_writes:
+            if self._bulk_task is None:
+                self._bulk_task = asyncio.create_task(self._run_bulk_writer())
+            pending_count = self._enqueue_update(user_id_str, update)
+            if pending_count >= MONGODB_BULK_MAX_PENDING:
+                # Fila cheia: quem chega aguarda a gravação (backpressure)
+                await self.flush()
+            elif len(self._pending_updates) >= MONGODB_BULK_BATCH_SIZE:
+                self._bulk_wakeup.set()
+            return
+        
+        await self.users_collection.update_one(
             {"user_id": user_id_str},
-            {
-                "$set": update_data,
-                "$push": {
-                    "conversation_history": {
-                        "$each": [new_interaction],
-                        "$slice": -10  # Mantém apenas as 10 últimas interações
-                    },
-                    "topics": {
-                        "$each": new_topics
-                    }
-                }
-            }
+            update,
+            upsert=True
         )
         
         logger.debug(f"Interação do usuário {user_id_str} atualizada no MongoDB")
     
-    def get_conversation_summary(self, user_id):
+    async def get_conversation_summary(self, user_id):
         """Obtém um resumo das conversas recentes com o usuário."""
         if not self.is_connected():
             logger.warning("MongoDB não está conectado. Não foi possível obter resumo da conversa.")
             return "Não foi possível acessar o histórico de conversas."
         
-        user_id_str = str(user_id)
-        user_doc = self.get_user_info(user_id)
+        return self._format_summary(await self.get_user_info(user_id))
+    
+    async def _write_batch(self, batch, retry_duplicates=True):
+        """Grava um lote, repetindo uma vez as operações que falharem por chave duplicada."""
+        pymongo = COMPONENTS.module("pymongo")
+        try:
+            await self.users_collection.bulk_write(batch, ordered=False)
+            logger.debug(f"Lote de {len(batch)} usuários gravado no MongoDB")
+        except pymongo.errors.BulkWriteError as e:
+            duplicates, failed = self._duplicate_key_ops(batch, e)
+            if failed:
+                logger.error(f"Erro na gravação em lote no MongoDB ({failed} de {len(batch)} usuários): {str(e)}")
+            if duplicates and retry_duplicates:
+                logger.info(f"Repetindo {len(duplicates)} upserts que falharam por chave duplicada")
+                await self._write_batch(duplicates, retry_duplicates=False)
+            elif duplicates:
+                logger.error(f"Upserts falharam novamente por chave duplicada ({len(duplicates)} usuários)")
+        except Exception as e:
+            logger.error(f"Erro na gravação em lote no MongoDB ({len(batch)} usuários): {str(e)}")
+    
+    async def flush(self):
+        """Grava todas as interações pendentes em lotes não ordenados."""
+        async with self._flush_lock:
+            while True:
+                user_ids, batch = self._take_batch()
+                if not batch:
+                    return
+                await self._write_batch(batch)
+                self._flushed_users.extend(user_ids)
+    
+    async def _run_bulk_writer(self):
+        """Grava a fila periodicamente ou quando um lote completo se forma."""
+        while not self._bulk_stopped:
+            try:
+                await asyncio.wait_for(self._bulk_wakeup.wait(), MONGODB_BULK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._bulk_wakeup.clear()
+            await self.flush()
+    
+    async def close(self):
+        """Grava as interações pendentes e fecha o cliente do MongoDB."""
+        self._bulk_stopped = True
+        self._bulk_wakeup.set()
+        if self._bulk_task is not None:
+            await self._bulk_task
+        if self.is_connected():
+            await self.flush()
+            self.client.close()
+
+class OpenAIAdvisor:
+    def __init__(self):
+        logger.info("Iniciando configuração da API OpenAI...")
+        try:
+            if not OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente!")
+            
+            # Cliente assíncrono para não bloquear o event loop durante as chamadas
+            self.client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT)
+            self.openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+            
+            # Verificando se devemos usar MongoDB ou armazenamento local
+            mongodb_uri = os.getenv('MONGODB_URI')
+            if mongodb_uri:
+                logger.info("Usando MongoDB para armazenamento de dados")
+                self.storage = AsyncMongoDBStorage() if MONGODB_ASYNC else MongoDBStorage()
+                # Verificando se a conexão foi bem-sucedida
+                if not self.storage.is_connected():
+                    logger.warning("Falha na conexão com MongoDB. Usando armazenamento local como fallback.")
+                    self.storage = self._create_local_storage()
+            else:
+                logger.info("Usando armazenamento local para dados dos usuários")
+                self.storage = self._create_local_storage()
+            
+            # Inicializando o gerenciador de personalidades e analisador de texto
+            self.personality_manager = PersonalityManager()
+            self.text_analyzer = TextAnalyzer()
+            
+            # Inicializando cache para evitar chamadas repetidas
+            self.cache_expiry = RESPONSE_CACHE_TTL  # Cache válido por 1 hora
+            self.response_cache = TTLCache(
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                default_ttl=self.cache_expiry,
+                max_bytes=RESPONSE_CACHE_MAX_BYTES
+            )
+            self.semantic_cache = SemanticCache(
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES
+            ) if SEMANTIC_CACHE_ENABLED else None
+                
+            logger.info("Cliente OpenAI configurado com sucesso!")
+        except Exception as e:
+            logger.error(f"Erro ao configurar cliente OpenAI: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise
+    
+    async def connect_storage(self):
+        """Confirma a conexão do armazenamento assíncrono e, sem ela, usa o armazenamento local."""
+        if isinstance(self.storage, AsyncMongoDBStorage) and not await self.storage.connect():
+            logger.warning("Falha na conexão com MongoDB. Usando armazenamento local como fallback.")
+            self.storage = self._create_local_storage()
+    
+    async def call_storage(self, method_name, *args):
+        """Chama um método do armazenamento, aguardando o resultado se ele for assíncrono."""
+        with TIMINGS.span(f"armazenamento: {method_name}"):
+            result = getattr(self.storage, method_name)(*args)
+            if inspect.isawaitable(result):
+                result = await result
+        return result
+    
+    @staticmethod
+    def _create_local_storage():
+        """Cria o armazenamento local configurado (JSON ou SQLite)."""
+        if LOCAL_STORAGE == "sqlite":
+            logger.info(f"Usando SQLite para armazenamento local: {SQLITE_DB_FILE}")
+            return SQLiteUserMemory()
+        return UserMemory()
+    
+    def analyze_message(self, text):
+        """Analisa a mensagem uma única vez, incluindo a personalidade mais apropriada para ela."""
+        with TIMINGS.span("análise de texto"):
+            return self.text_analyzer.analyze_message(
+                text,
+                self.personality_manager.select_appropriate_personality(text)
+            )
+    
+    def _get_current_date(self):
+        """Retorna a data atual formatada."""
+        return datetime.now().strftime("%d/%m/%Y")
+    
+    async def _create_completion(self, messages, **kwargs):
+        """Executa uma chamada de chat completion respeitando o limite global de concorrência."""
+        async with self.openai_semaphore:
+            with TIMINGS.span("openai"), METRICS.in_flight("bot_generations_in_flight"):
+                response = await self.client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    **kwargs
+                )
         
-        if not user_doc or not user_doc.get("conversation_history"):
-            return "Não há histórico de conversas anteriores."
+        if response.usage:
+            METRICS.inc("bot_openai_tokens_total", response.usage.prompt_tokens, type="prompt")
+            METRICS.inc("bot_openai_tokens_total", response.usage.completion_tokens, type="completion")
+        return response
+    
+    @staticmethod
+    def _cache_key(user_id, question):
+        """Chave do cache: usuário e pergunta normalizada (minúsculas, espaços colapsados)."""
+        return str(user_id), " ".join(question.lower().split())
+    
+    def _is_question_in_cache(self, user_id, question):
+        """Verifica se a mesma pergunta está no cache."""
+        return self.response_cache.get(self._cache_key(user_id, question))
+    
+    @staticmethod
+    def _cache_scope(user_id, personality_type, context_data=None):
+        """Escopo da correspondência aproximada: usuário, personalidade e contexto."""
+        return str(user_id), personality_type, context_data or ""
+    
+    def _find_cached_response(self, user_id, question, context_data=None, analysis=None):
+        """Procura a pergunta exata no cache e, se não houver, uma pergunta equivalente.
         
-        summary = "Resumo das conversas recentes:\n\n"
+        As consultas intermediárias usam peek; só a consulta final passa por get,
+        para que cada pergunta conte um único acerto ou erro nas estatísticas.
+        """
+        hit_key = self._cache_key(user_id, question)
+        if self.response_cache.peek(hit_key) is None and self.semantic_cache is not None:
+            if analysis is None:
+                analysis = self.analyze_message(question)
+            scope = self._cache_scope(user_id, analysis.personality_type, context_data)
+            key = self.semantic_cache.find(scope, question)
+            if key is not None:
+                if self.response_cache.peek(key) is None:
+                    # Resposta já expirou ou foi descartada do cache
+                    self.semantic_cache.remove(key)
+                else:
+                    logger.info(f"Pergunta semelhante encontrada no cache: '{key[1]}'")
+                    hit_key = key
         
-        # Pegando as 3 últimas interações
-        recent_interactions = user_doc["conversation_history"][-3:]
+        return self.response_cache.get(hit_key)
+    
+    def _add_to_cache(self, user_id, question, response, scope=None):
+        """Adiciona uma resposta ao cache."""
+        key = self._cache_key(user_id, question)
+        self.response_cache.set(
+            key,
+            response,
+            size=sys.getsizeof(question) + sys.getsizeof(response)
+        )
+        if self.semantic_cache is not None and scope is not None:
+            self.semantic_cache.add(scope, key, question)
+    
+    def _clean_expired_cache(self):
+        """Limpa entradas expiradas do cache."""
+        self.response_cache.purge_expired()
+    
+    def cache_stats(self):
+        """Retorna as estatísticas do cache de respostas."""
+        return self.response_cache.stats()
+    
+    @staticmethod
+    def _formality_level(sentiment, question_complexity):
+        """Calcula o nível de formalidade (0 a 4) a partir do sentimento e da complexidade."""
+        formality_level = 2  # Padrão é moderado
+        if sentiment in ["positivo", "muito_positivo"]:
+            formality_level = 1  # Mais informal para sentimentos positivos
+        elif sentiment in ["negativo", "muito_negativo"]:
+            formality_level = 3  # Mais formal para sentimentos negativos
+        
+        if question_complexity == "complexo":
+            formality_level += 1  # Mais formal para perguntas complexas
+        elif question_complexity == "simples":
+            formality_level -= 1  # Mais informal para perguntas simples
+        
+        # Ajustando para ficar entre 0 e 4
+        return max(0, min(formality_level, 4))
+    
+    def _build_system_prompt(self, personality, formality_level, sentiment, long_term_context="", conversation_context="", web_search_results=""):
+        """Monta o prompt de sistema com a personalidade, o estilo e o contexto da conversa."""
+        return f"""Você é {personality['name']}, {personality['description']} com mais de 15 anos no mercado. Responda como um especialista conversando de forma {personality['tone']}.
+        
+        CONTEXTO DO USUÁRIO:
+        {long_term_context}
+        
+        REGRAS DE ESTILO:
+        1. PERSONALIDADE: {personality['description']}
+        2. TOM: {personality['tone']}
+        3. FORMALIDADE: {self.personality_manager.formality_levels[formality_level]}
+        4. EXPERTISE: {personality['expertise']}
+        5. ESTILO CONVERSACIONAL: {personality['conversation_style']}
+        
+        REGRAS CRÍTICAS:
+        1. ADAPTE A PROFUNDIDADE DA RESPOSTA:
+           - Para perguntas simples: use 1-3 frases informativas e diretas
+           - Para perguntas técnicas: forneça respostas mais detalhadas (até 5-8 frases)
+           - Quando o usuário pedir detalhes: seja abrangente e didático
+        
+        2. LINGUAGEM NATURAL BRASILEIRA:
+           - Use expressões como "{', '.join(personality['speech_patterns'][:3])}" ocasionalmente
+           - Quando apropriado, use "{', '.join(personality['casual_expressions'][:3])}"
+           - Adapte seu vocabulário ao nível de conhecimento do usuário
+        
+        3. RESPOSTA AO SENTIMENTO:
+           - Sentimento atual detectado: {sentiment}
+           - Ajuste seu tom para corresponder adequadamente
+        
+        4. ESTRUTURA:
+           - Comece com um cumprimento breve ou reconhecimento se apropriado
+           - Desenvolva a resposta em um fluxo conversacional natural
+           - Conclua de forma prática e útil
+        
+        5. AUTENTICIDADE:
+           - Você é um especialista real, não um chatbot
+           - Responda com autoridade e experiência prática
+           - Admita quando não souber algo
+        
+        {conversation_context}
+        
+        {web_search_results}
+        
+        Dada sua experiência, analise a pergunta e forneça uma resposta humana adaptada ao contexto - seja concisa para perguntas simples ou detalhada para questões complexas ou específicas."""
+    
+    @TIMINGS.timed("geração: preparo do prompt")
+    async def _prepare_generation(self, user_input, user_id, context_data=None, search_web=True, analysis=None):
+        """Monta o prompt e os parâmetros de estilo da resposta a partir da análise da mensagem."""
+        # Obtendo informações do usuário
+        user_info = await self.call_storage("get_user_info", user_id)
+        
+        # Características da mensagem, analisadas uma única vez
+        if analysis is None:
+            analysis = self.analyze_message(user_input)
+        sentiment = analysis.sentiment
+        user_region = analysis.region or user_info.get("detected_region")
+        question_complexity = analysis.question_complexity
+        
+        # Analisando se houve mudança de tópico
+        intent_changed = False
+        if hasattr(self.storage, 'detect_intent_change'):
+            intent_changed = self.storage.detect_intent_change(user_id, user_input, analysis)
+        
+        # Personalidade apropriada para a mensagem
+        personality_type = analysis.personality_type
+        personality = self.personality_manager.get_personality(personality_type)
+        
+        # Ajustando nível de formalidade com base no sentimento e complexidade
+        formality_level = self._formality_level(sentiment, question_complexity)
+        
+        # Realizando pesquisa na web se necessário
+        web_search_results = ""
+        if search_web and analysis.keywords.any("search", "generation"):
+            logger.info("Detectada necessidade de informações atualizadas. Realizando pesquisa web.")
+            search_query = f"finanças {user_input} brasil atual"
+            results = await GoogleSearch.search_google(search_query)
+            if results:
+                web_search_results = GoogleSearch.format_search_results(results)
+        
+        # Obtendo contexto de memória de longo prazo
+        long_term_context = ""
+        if hasattr(self.storage, 'get_long_term_context'):
+            long_term_context = self.storage.get_long_term_context(user_id)
+        
+        # Construindo o contexto da conversa (últimas interações para continuidade)
+        conversation_context = ""
+        if user_info:
+            if isinstance(self.storage, MongoDBStorage):
+                # Para MongoDB
+                if user_info.get("interaction_count", 0) > 0 and user_info.get("conversation_history"):
+                    last_interactions = user_info["conversation_history"][-2:] if intent_changed else user_info["conversation_history"][-3:]
+                    if last_interactions:
+                        conversation_context = "Últimas conversas:\n"
+                        for interaction in last_interactions:
+                            conversation_context += f"Usuário: {interaction['user_message']}\n"
+                            conversation_context += f"Você: {interaction['bot_response'][:100]}...\n\n"
+            else:
+                # Para UserMemory
+                if user_info.get("interaction_count", 0) > 0 and user_info.get("conversation_history"):
+                    last_interactions = user_info["conversation_history"][-2:] if intent_changed else user_info["conversation_history"][-3:]
+                    if last_interactions:
+                        conversation_context = "Últimas conversas:\n"
+                        for interaction in last_interactions:
+                            conversation_context += f"Usuário: {interaction['user_message']}\n"
+                            conversation_context += f"Você: {interaction['bot_response'][:100]}...\n\n"
+        
+        # Adicionando dados de contexto específicos se fornecidos
+        if context_data:
+            conversation_context += f"\nContexto adicional: {context_data}\n\n"
+        
+        # Sistema de prompt para personalidades diferentes e respostas humanizadas
+        system_prompt = self._build_system_prompt(
+            personality, formality_level, sentiment,
+            long_term_context, conversation_context, web_search_results
+        )
+        
+        return {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ],
+            "personality_type": personality_type,
+            "formality_level": formality_level,
+            "user_region": user_region,
+            "cache_scope": self._cache_scope(user_id, personality_type, context_data),
+            "analysis": analysis
+        }
+    
+    @TIMINGS.timed("geração: humanização e registro")
+    async def _finalize_response(self, user_id, user_input, raw_response, generation):
+        """Humaniza e formata a resposta bruta, atualizando a memória e o cache."""
+        personality_type = generation["personality_type"]
+        formality_level = generation["formality_level"]
+        user_region = generation["user_region"]
+        
+        # Humanizando a resposta com o estilo da personalidade escolhida
+        humanized_response = self.personality_manager.create_human_variation(
+            raw_response,
+            personality_type=personality_type,
+            formality_level=formality_level,
+            add_fillers=(formality_level <= 3)  # Adiciona fillers apenas em níveis mais informais
+        )
+        
+        # Adicionando expressões regionais ocasionalmente se uma região foi detectada
+        if user_region and random.random() < 0.3:
+            regional_expressions = self.personality_manager.get_regional_expressions(user_region)
+            if regional_expressions and random.random() < 0.5:  # 50% de chance
+                regional_expr = random.choice(regional_expressions)
+                sentences = humanized_response.split('. ')
+                if len(sentences) > 2:
+                    # Inserindo expressão regional em uma frase aleatória (não a primeira nem a última)
+                    insert_pos = random.randint(1, len(sentences) - 2)
+                    sentences[insert_pos] = f"{sentences[insert_pos][:-1]}, {regional_expr}"
+                    humanized_response = '. '.join(sentences)
+        
+        # Formatando para Markdown
+        formatted_response = humanized_response.replace('*', '\\*')
+        formatted_response = formatted_response.replace('_', '\\_')
+        formatted_response = formatted_response.replace('`', '\\`')
         
-        for i, interaction in enumerate(recent_interactions, 1):
-            timestamp = interaction["timestamp"].strftime("%d/%m/%Y %H:%M") if isinstance(interaction["timestamp"], datetime) else "Data desconhecida"
-            summary += f"Interação {i} ({timestamp}):\n"
-            summary += f"Usuário: {interaction['user_message']}\n"
-            summary += f"Bot: {interaction['bot_response'][:100]}...\n\n"
+        # Atualizando a memória do usuário
+        await self.call_storage("update_user_interaction", user_id, user_input, formatted_response, generation.get("analysis"))
         
-        summary += f"Tópicos de interesse: {', '.join(user_doc['topics']) if user_doc['topics'] else 'Nenhum identificado ainda'}\n"
-        summary += f"Total de interações: {user_doc['interaction_count']}"
+        # Adicionando ao cache
+        self._add_to_cache(user_id, user_input, formatted_response, scope=generation["cache_scope"])
         
-        return summary
-
-class OpenAIAdvisor:
-    def __init__(self):
-        logger.info("Iniciando configuração da API OpenAI...")
-        try:
-            if not OPENAI_API_KEY:
-                raise ValueError("OPENAI_API_KEY não encontrada nas variáveis de ambiente!")
-            
-            self.client = OpenAI(api_key=OPENAI_API_KEY)
-            
-            # Verificando se devemos usar MongoDB ou armazenamento local
-            mongodb_uri = os.getenv('MONGODB_URI')
-            if mongodb_uri:
-                logger.info("Usando MongoDB para armazenamento de dados")
-                self.storage = MongoDBStorage()
-                # Verificando se a conexão foi bem-sucedida
-                if not self.storage.is_connected():
-                    logger.warning("Falha na conexão com MongoDB. Usando armazenamento local como fallback.")
-                    self.storage = UserMemory()
-            else:
-                logger.info("Usando armazenamento local para dados dos usuários")
-                self.storage = UserMemory()
-            
-            # Inicializando o gerenciador de personalidades e analisador de texto
-            self.personality_manager = PersonalityManager()
-            self.text_analyzer = TextAnalyzer()
-            
-            # Inicializando cache para evitar chamadas repetidas
-            self.response_cache = {}
-            self.cache_expiry = 3600  # Cache válido por 1 hora
-                
-            logger.info("Cliente OpenAI configurado com sucesso!")
-        except Exception as e:
-            logger.error(f"Erro ao configurar cliente OpenAI: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            raise
-    
-    def _get_current_date(self):
-        """Retorna a data atual formatada."""
-        return datetime.now().strftime("%d/%m/%Y")
+        return formatted_response
     
-    def _is_question_in_cache(self, user_id, question):
-        """Verifica se uma pergunta semelhante está no cache."""
-        if user_id not in self.response_cache:
-            return None
+    async def generate_shared_answer(self, prompt, personality_type, context_data=None, search_web=False):
+        """Gera uma resposta bruta, sem dados de usuário, para ser compartilhada entre usuários.
         
-        for cached_q, response_data in self.response_cache[user_id].items():
-            # Verifica similaridade básica
-            if cached_q.lower() == question.lower():
-                timestamp = response_data["timestamp"]
-                # Verifica se o cache ainda é válido
-                if (datetime.now() - timestamp).total_seconds() < self.cache_expiry:
-                    return response_data["response"]
+        Retorna a resposta e o nível de formalidade usado, para a humanização no momento do envio.
+        """
+        personality = self.personality_manager.get_personality(personality_type)
+        analysis = self.text_analyzer.analyze_message(prompt, personality_type)
+        sentiment = analysis.sentiment
+        formality_level = self._formality_level(sentiment, analysis.question_complexity)
         
-        return None
-    
-    def _add_to_cache(self, user_id, question, response):
-        """Adiciona uma resposta ao cache."""
-        if user_id not in self.response_cache:
-            self.response_cache[user_id] = {}
+        web_search_results = ""
+        if search_web:
+            results = await GoogleSearch.search_google(f"finanças {prompt} brasil atual")
+            if results:
+                web_search_results = GoogleSearch.format_search_results(results)
         
-        self.response_cache[user_id][question] = {
-            "response": response,
-            "timestamp": datetime.now()
+        conversation_context = f"\nContexto adicional: {context_data}\n\n" if context_data else ""
+        system_prompt = self._build_system_prompt(
+            personality, formality_level, sentiment,
+            conversation_context=conversation_context, web_search_results=web_search_results
+        )
+        
+        response = await self._create_completion(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=800,
+            top_p=0.9
+        )
+        return response.choices[0].message.content, formality_level
+    
+    async def serve_shared_answer(self, user_id, prompt, raw_response, personality_type, formality_level):
+        """Humaniza uma resposta compartilhada para o usuário e registra a interação."""
+        user_info = await self.call_storage("get_user_info", user_id)
+        generation = {
+            "personality_type": personality_type,
+            "formality_level": formality_level,
+            "user_region": user_info.get("detected_region") if user_info else None,
+            "cache_scope": None
         }
+        return await self._finalize_response(user_id, prompt, raw_response, generation)
     
-    def _clean_expired_cache(self):
-        """Limpa entradas expiradas do cache."""
-        for user_id in list(self.response_cache.keys()):
-            for question in list(self.response_cache[user_id].keys()):
-                timestamp = self.response_cache[user_id][question]["timestamp"]
-                if (datetime.now() - timestamp).total_seconds() > self.cache_expiry:
-                    del self.response_cache[user_id][question]
-            
-            # Remove usuário do cache se não tiver mais entradas
-            if not self.response_cache[user_id]:
-                del self.response_cache[user_id]
-
-    async def generate_response(self, user_input: str, user_id: int, context_data=None, search_web=True):
+    @TIMINGS.timed("geração (total)")
+    async def generate_response(self, user_input: str, user_id: int, context_data=None, search_web=True, analysis=None):
         try:
             logger.debug(f"Gerando resposta para input: {user_input}")
             
@@ -1163,186 +3419,426 @@ class OpenAIAdvisor:
             self._clean_expired_cache()
             
             # Verificando cache para perguntas semelhantes
-            cached_response = self._is_question_in_cache(user_id, user_input)
+            if analysis is None:
+                analysis = self.analyze_message(user_input)
+            cached_response = self._find_cached_response(user_id, user_input, context_data, analysis)
             if cached_response:
                 logger.info("Resposta encontrada no cache")
                 return cached_response
             
-            # Obtendo informações do usuário
-            user_info = self.storage.get_user_info(user_id)
-            
-            # Analisando características da mensagem
-            sentiment = self.text_analyzer.analyze_sentiment(user_input)
-            user_region = self.text_analyzer.detect_user_region(user_input) or user_info.get("detected_region")
-            question_complexity = self.text_analyzer.detect_question_complexity(user_input)
-            
-            # Analisando se houve mudança de tópico
-            intent_changed = False
-            if hasattr(self.storage, 'detect_intent_change'):
-                intent_changed = self.storage.detect_intent_change(user_id, user_input)
-            
-            # Selecionando personalidade apropriada
-            personality_type = self.personality_manager.select_appropriate_personality(user_input, user_info)
-            personality = self.personality_manager.get_personality(personality_type)
-            
-            # Ajustando nível de formalidade com base no sentimento e complexidade
-            formality_level = 2  # Padrão é moderado
-            if sentiment in ["positivo", "muito_positivo"]:
-                formality_level = 1  # Mais informal para sentimentos positivos
-            elif sentiment in ["negativo", "muito_negativo"]:
-                formality_level = 3  # Mais formal para sentimentos negativos
-            
-            if question_complexity == "complexo":
-                formality_level += 1  # Mais formal para perguntas complexas
-            elif question_complexity == "simples":
-                formality_level -= 1  # Mais informal para perguntas simples
-            
-            # Ajustando para ficar entre 0 e 4
-            formality_level = max(0, min(formality_level, 4))
-            
-            # Realizando pesquisa na web se necessário
-            web_search_results = ""
-            if search_web and any(keyword in user_input.lower() for keyword in ["atual", "hoje", "recente", "notícia", "mercado", "taxa", "cotação", "preço", "inflação", "selic", "dólar", "euro", "bolsa"]):
-                logger.info("Detectada necessidade de informações atualizadas. Realizando pesquisa web.")
-                search_query = f"finanças {user_input} brasil atual"
-                results = await GoogleSearch.search_google(search_query)
-                if results:
-                    web_search_results = GoogleSearch.format_search_results(results)
-            
-            # Obtendo contexto de memória de longo prazo
-            long_term_context = ""
-            if hasattr(self.storage, 'get_long_term_context'):
-                long_term_context = self.storage.get_long_term_context(user_id)
-            
-            # Construindo o contexto da conversa (últimas interações para continuidade)
-            conversation_context = ""
-            if user_info:
-                if isinstance(self.storage, MongoDBStorage):
-                    # Para MongoDB
-                    if user_info.get("interaction_count", 0) > 0 and user_info.get("conversation_history"):
-                        last_interactions = user_info["conversation_history"][-2:] if intent_changed else user_info["conversation_history"][-3:]
-                        if last_interactions:
-                            conversation_context = "Últimas conversas:\n"
-                            for interaction in last_interactions:
-                                conversation_context += f"Usuário: {interaction['user_message']}\n"
-                                conversation_context += f"Você: {interaction['bot_response'][:100]}...\n\n"
-            else:
-                    # Para UserMemory
-                    if user_info.get("interaction_count", 0) > 0 and user_info.get("conversation_history"):
-                        last_interactions = user_info["conversation_history"][-2:] if intent_changed else user_info["conversation_history"][-3:]
-                        if last_interactions:
-                            conversation_context = "Últimas conversas:\n"
-                            for interaction in last_interactions:
-                                conversation_context += f"Usuário: {interaction['user_message']}\n"
-                                conversation_context += f"Você: {interaction['bot_response'][:100]}...\n\n"
-            
-            # Adicionando dados de contexto específicos se fornecidos
-            if context_data:
-                conversation_context += f"\nContexto adicional: {context_data}\n\n"
-            
-            # Sistema de prompt para personalidades diferentes e respostas humanizadas
-            system_prompt = f"""Você é {personality['name']}, {personality['description']} com mais de 15 anos no mercado. Responda como um especialista conversando de forma {personality['tone']}.
-
-            CONTEXTO DO USUÁRIO:
-            {long_term_context}
-            
-            REGRAS DE ESTILO:
-            1. PERSONALIDADE: {personality['description']}
-            2. TOM: {personality['tone']} 
-            3. FORMALIDADE: {self.personality_manager.formality_levels[formality_level]}
-            4. EXPERTISE: {personality['expertise']}
-            5. ESTILO CONVERSACIONAL: {personality['conversation_style']}
-            
-            REGRAS CRÍTICAS:
-            1. ADAPTE A PROFUNDIDADE DA RESPOSTA:
-               - Para perguntas simples: use 1-3 frases informativas e diretas
-               - Para perguntas técnicas: forneça respostas mais detalhadas (até 5-8 frases)
-               - Quando o usuário pedir detalhes: seja abrangente e didático
-            
-            2. LINGUAGEM NATURAL BRASILEIRA:
-               - Use expressões como "{', '.join(personality['speech_patterns'][:3])}" ocasionalmente
-               - Quando apropriado, use "{', '.join(personality['casual_expressions'][:3])}"
-               - Adapte seu vocabulário ao nível de conhecimento do usuário
-            
-            3. RESPOSTA AO SENTIMENTO:
-               - Sentimento atual detectado: {sentiment}
-               - Ajuste seu tom para corresponder adequadamente
-            
-            4. ESTRUTURA:
-               - Comece com um cumprimento breve ou reconhecimento se apropriado
-               - Desenvolva a resposta em um fluxo conversacional natural
-               - Conclua de forma prática e útil
-            
-            5. AUTENTICIDADE:
-               - Você é um especialista real, não um chatbot
-               - Responda com autoridade e experiência prática
-               - Admita quando não souber algo
-            
-            {conversation_context}
-            
-            {web_search_results}
-            
-            Dada sua experiência, analise a pergunta e forneça uma resposta humana adaptada ao contexto - seja concisa para perguntas simples ou detalhada para questões complexas ou específicas."""
+            generation = await self._prepare_generation(user_input, user_id, context_data, search_web, analysis)
             
             logger.debug("Enviando requisição para a API da OpenAI...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input}
-                ],
+            response = await self._create_completion(
+                messages=generation["messages"],
                 temperature=0.7,
                 max_tokens=800,
                 top_p=0.9
             )
             
             raw_response = response.choices[0].message.content
-            logger.debug(f"Resposta bruta da OpenAI: {raw_response}")
-            
-            # Humanizando a resposta com o estilo da personalidade escolhida
-            humanized_response = self.personality_manager.create_human_variation(
-                raw_response,
-                personality_type=personality_type,
-                formality_level=formality_level,
-                add_fillers=(formality_level <= 3)  # Adiciona fillers apenas em níveis mais informais
-            )
+            logger.debug(f"Resposta bruta da OpenAI recebida ({len(raw_response or '')} caracteres)")
             
-            # Adicionando expressões regionais ocasionalmente se uma região foi detectada
-            if user_region and random.random() < 0.3:
-                regional_expressions = self.personality_manager.get_regional_expressions(user_region)
-                if regional_expressions and random.random() < 0.5:  # 50% de chance
-                    regional_expr = random.choice(regional_expressions)
-                    sentences = humanized_response.split('. ')
-                    if len(sentences) > 2:
-                        # Inserindo expressão regional em uma frase aleatória (não a primeira nem a última)
-                        insert_pos = random.randint(1, len(sentences) - 2)
-                        sentences[insert_pos] = f"{sentences[insert_pos][:-1]}, {regional_expr}"
-                        humanized_response = '. '.join(sentences)
-
-            # Formatando para Markdown
-            formatted_response = humanized_response.replace('*', '\\*')
-            formatted_response = formatted_response.replace('_', '\\_')
-            formatted_response = formatted_response.replace('`', '\\`')
+            return await self._finalize_response(user_id, user_input, raw_response, generation)
+        
+        except Exception as e:
+            logger.error(f"Erro na geração de resposta: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return "Ops! Tive um problema ao processar sua pergunta. Pode tentar novamente?"
+    
+    async def _stream_completion(self, messages, updates):
+        """Consome o stream da OpenAI dentro do limite de concorrência.
+        
+        Publica o texto acumulado em updates a cada trecho e None ao terminar; o semáforo
+        é liberado assim que o stream acaba, sem esperar quem exibe os trechos.
+        """
+        raw_response = ""
+        try:
+            async with self.openai_semaphore:
+                with TIMINGS.span("openai (streaming)"), METRICS.in_flight("bot_generations_in_flight"):
+                    stream = await self.client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=800,
+                        top_p=0.9,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            raw_response += delta
+                            updates.put_nowait(raw_response)
+        finally:
+            updates.put_nowait(None)
+        return raw_response
+    
+    async def generate_response_stream(self, user_input: str, user_id: int, context_data=None, search_web=True, analysis=None):
+        """Gera a resposta em modo streaming.
+        
+        Produz tuplas (texto, final): o texto bruto acumulado à medida que os tokens
+        chegam e, por último, a resposta humanizada e formatada com final=True.
+        """
+        try:
+            logger.debug(f"Gerando resposta (streaming) para input: {user_input}")
+            
+            self._clean_expired_cache()
             
-            # Atualizando a memória do usuário
-            self.storage.update_user_interaction(user_id, user_input, formatted_response)
+            if analysis is None:
+                analysis = self.analyze_message(user_input)
+            cached_response = self._find_cached_response(user_id, user_input, context_data, analysis)
+            if cached_response:
+                logger.info("Resposta encontrada no cache")
+                yield cached_response, True
+                return
             
-            # Adicionando ao cache
-            self._add_to_cache(user_id, user_input, formatted_response)
+            generation = await self._prepare_generation(user_input, user_id, context_data, search_web, analysis)
             
-            return formatted_response
-
+            logger.debug("Enviando requisição (streaming) para a API da OpenAI...")
+            # O stream é consumido em uma tarefa própria: as edições no Telegram (e as esperas
+            # de RetryAfter) acontecem fora do limite de concorrência da OpenAI
+            updates = asyncio.Queue()
+            producer = asyncio.create_task(self._stream_completion(generation["messages"], updates))
+            try:
+                while True:
+                    text = await updates.get()
+                    # Trechos acumulados enquanto o Telegram era atualizado: só o mais recente importa
+                    while not updates.empty():
+                        text = updates.get_nowait()
+                    if text is None:
+                        break
+                    yield text, False
+                raw_response = await producer
+            finally:
+                if not producer.done():
+                    producer.cancel()
+            
+            logger.debug(f"Resposta bruta da OpenAI recebida ({len(raw_response or '')} caracteres)")
+            yield await self._finalize_response(user_id, user_input, raw_response, generation), True
+        
         except Exception as e:
-            logger.error(f"Erro na geração de resposta: {str(e)}")
+            logger.error(f"Erro na geração de resposta (streaming): {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
-            return "Ops! Tive um problema ao processar sua pergunta. Pode tentar novamente?"
+            yield "Ops! Tive um problema ao processar sua pergunta. Pode tentar novamente?", True
+
+class MenuAnswerPool:
+    """Respostas pré-geradas e compartilhadas para os botões do menu inline.
+    
+    Cada botão tem um prompt fixo e uma personalidade; a resposta bruta é gerada uma vez
+    por um job em segundo plano e humanizada por usuário no momento do envio. Depois da
+    geração inicial, só são atualizados os tópicos que alguém pediu desde a última geração.
+    """
+    
+    PROMPTS = {
+        'investments': "Quais são as principais opções de investimento no Brasil hoje, considerando diferentes perfis de risco e objetivos financeiros? O que você recomenda para quem está começando?",
+        'fixed_income': "Detalhe as melhores opções de renda fixa disponíveis no Brasil atualmente, com seus rendimentos aproximados, tributação, riscos e para qual perfil de investidor cada uma é mais adequada.",
+        'variable_income': "Quais são as melhores estratégias para investir em renda variável no Brasil atualmente? Fale sobre ações, FIIs, ETFs e BDRs, com dicas práticas para diferentes perfis de investidor.",
+        'funds': "Explique os principais tipos de fundos de investimento disponíveis no Brasil, suas características, vantagens e desvantagens. Como escolher o fundo mais adequado para cada objetivo?",
+        'crypto': "Qual a melhor forma de investir em criptomoedas com segurança no Brasil? Quais são as principais criptomoedas, exchanges confiáveis e estratégias recomendadas para diferentes perfis?",
+        'planning': "Como elaborar um planejamento financeiro completo e eficiente? Quais são as etapas essenciais, desde o orçamento pessoal até a aposentadoria?",
+        'market_analysis': "Como está o cenário macroeconômico e o mercado financeiro brasileiro atualmente? Quais são as perspectivas para os próximos meses e como isso afeta as decisões de investimento?",
+        'news': "Quais são as principais notícias econômicas e financeiras recentes que podem impactar os investimentos no Brasil? Como os investidores devem se posicionar diante desses acontecimentos?",
+        'help': "De que maneiras você pode me ajudar com planejamento financeiro, investimentos e educação financeira? Quais são seus diferenciais como consultor?"
+    }
+    
+    # Para análise de mercado e notícias, sempre pesquisar na web
+    SEARCH_TOPICS = ['market_analysis', 'news']
+    
+    # Para tópicos específicos, solicitar respostas mais detalhadas
+    DETAILED_TOPICS = ['variable_income', 'funds', 'crypto', 'planning']
+    DETAILED_CONTEXT = "Este é um tópico complexo que exige uma explicação detalhada. Forneça uma resposta abrangente com pontos específicos e exemplos práticos."
+    
+    # Intervalo entre verificações de respostas vencidas (segundos)
+    CHECK_INTERVAL = 60
+    
+    def __init__(self, advisor):
+        self.advisor = advisor
+        self.answers = {}  # (tópico, personalidade) -> resposta bruta, formalidade e horário
+        self.requested = set()  # tópicos pedidos desde a última geração
+    
+    @staticmethod
+    def personality_for(topic):
+        """Seleciona uma personalidade apropriada para o tópico."""
+        if topic in ['variable_income', 'market_analysis', 'crypto']:
+            return "technical"  # Tópicos mais técnicos
+        elif topic in ['planning', 'help']:
+            return "mentor"     # Tópicos de planejamento/educação
+        elif topic in ['investments']:
+            return "friendly"   # Tópicos para iniciantes
+        return "default"
+    
+    @classmethod
+    def context_for(cls, topic):
+        """Contexto adicional enviado junto com o prompt do tópico."""
+        return cls.DETAILED_CONTEXT if topic in cls.DETAILED_TOPICS else None
+    
+    @classmethod
+    def refresh_interval(cls, topic):
+        """Intervalo de atualização do tópico; tópicos com pesquisa web envelhecem mais rápido."""
+        if topic in cls.SEARCH_TOPICS:
+            return MENU_ANSWERS_VOLATILE_REFRESH_INTERVAL
+        return MENU_ANSWERS_REFRESH_INTERVAL
+    
+    def get(self, topic):
+        """Retorna a resposta compartilhada do tópico, ou None se não houver uma válida.
+        
+        Uma resposta continua válida por até duas vezes o intervalo de atualização,
+        cobrindo uma atualização que tenha falhado.
+        """
+        entry = self.answers.get((topic, self.personality_for(topic)))
+        if entry is None or time.time() - entry["generated_at"] > 2 * self.refresh_interval(topic):
+            return None
+        return entry
+    
+    async def refresh(self, topic):
+        """Gera novamente a resposta compartilhada de um tópico."""
+        personality_type = self.personality_for(topic)
+        try:
+            response, formality_level = await self.advisor.generate_shared_answer(
+                self.PROMPTS[topic],
+                personality_type,
+                context_data=self.context_for(topic),
+                search_web=topic in self.SEARCH_TOPICS
+            )
+            self.answers[(topic, personality_type)] = {
+                "response": response,
+                "formality_level": formality_level,
+                "generated_at": time.time()
+            }
+            logger.info(f"Resposta compartilhada do menu atualizada: {topic} ({personality_type})")
+        except Exception as e:
+            logger.error(f"Erro ao atualizar resposta compartilhada do menu '{topic}': {str(e)}")
+    
+    def _due_topics(self):
+        """Tópicos pedidos desde a última geração cuja resposta falta ou passou do intervalo de atualização."""
+        now = time.time()
+        due = []
+        for topic in self.requested:
+            entry = self.answers.get((topic, self.personality_for(topic)))
+            if entry is None or now - entry["generated_at"] >= self.refresh_interval(topic):
+                due.append(topic)
+        return due
+    
+    async def run(self):
+        """Mantém as respostas atualizadas; executado como tarefa em segundo plano."""
+        # Geração inicial de todos os tópicos; depois, só os que foram pedidos
+        due = list(self.PROMPTS)
+        while True:
+            if due:
+                self.requested.difference_update(due)
+                # Gerações em paralelo, limitadas pelo semáforo global da OpenAI
+                await asyncio.gather(*(self.refresh(topic) for topic in due))
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            due = self._due_topics()
+    
+    async def serve(self, topic, user_id):
+        """Retorna a resposta do tópico humanizada para o usuário, ou None se não houver no pool."""
+        self.requested.add(topic)
+        entry = self.get(topic)
+        if entry is None:
+            return None
+        return await self.advisor.serve_shared_answer(
+            user_id,
+            self.PROMPTS[topic],
+            entry["response"],
+            self.personality_for(topic),
+            entry["formality_level"]
+        )
+
+class MetricsServer:
+    """Servidor HTTP mínimo que expõe as métricas no formato de texto do Prometheus.
+    
+    Roda no mesmo event loop da Application: cada coleta apenas lê os contadores em memória.
+    """
+    
+    LOOP_LAG_INTERVAL = 1.0  # segundos entre medições do atraso do event loop
+    READ_TIMEOUT = 5.0
+    
+    def __init__(self, bot, host, port):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.server = None
+    
+    async def start(self):
+        """Começa a aceitar conexões em segundo plano."""
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Métricas disponíveis em http://{self.host}:{self.port}/metrics")
+    
+    async def close(self):
+        """Para de aceitar conexões."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    async def monitor_loop_lag(self):
+        """Mede periodicamente quanto um timer atrasa em relação ao previsto."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.LOOP_LAG_INTERVAL)
+            METRICS.set("bot_event_loop_lag_seconds", max(0.0, loop.time() - started - self.LOOP_LAG_INTERVAL))
+    
+    @staticmethod
+    def _labels(labels):
+        """Formata os rótulos de uma amostra, com o escape exigido pelo formato de texto."""
+        if not labels:
+            return ""
+        
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+    
+    def _collect(self):
+        """Atualiza os medidores lidos sob demanda (fila de updates e caches)."""
+        if self.bot.app is not None:
+            # Com processamento concorrente a fila da Application esvazia logo; a espera fica no processador
+            depth = self.bot.app.update_queue.qsize()
+            processor = self.bot.app.update_processor
+            if isinstance(processor, PerUserUpdateProcessor):
+                depth += processor.pending
+            METRICS.set("bot_update_queue_depth", depth)
+        for cache, stats in (("responses", self.bot.advisor.cache_stats()), ("search", GoogleSearch.cache_stats())):
+            METRICS.set("bot_cache_hit_ratio", stats["hit_rate"], cache=cache)
+            METRICS.set("bot_cache_entries", stats["entries"], cache=cache)
+    
+    def render(self):
+        """Gera o corpo da resposta no formato de texto do Prometheus."""
+        self._collect()
+        lines = []
+        for name, (metric_type, description) in MetricsRegistry.DEFINITIONS.items():
+            samples = [(labels, value) for (sample_name, labels), value in list(METRICS.values.items()) if sample_name == name]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{self._labels(labels)} {value}" for labels, value in samples)
+        
+        # Histogramas por etapa (inclui OpenAI, pesquisa web e armazenamento)
+        lines.append("# HELP bot_stage_duration_seconds Duração de cada etapa do atendimento")
+        lines.append("# TYPE bot_stage_duration_seconds histogram")
+        for stage, buckets in list(TIMINGS.buckets.items()):
+            cumulative = 0
+            for bound, count in zip(TIMINGS.BUCKETS, buckets):
+                cumulative += count
+                lines.append(f"bot_stage_duration_seconds_bucket{self._labels([('stage', stage), ('le', bound)])} {cumulative}")
+            lines.append(f"bot_stage_duration_seconds_bucket{self._labels([('stage', stage), ('le', '+Inf')])} {TIMINGS.counts[stage]}")
+            lines.append(f"bot_stage_duration_seconds_sum{self._labels([('stage', stage)])} {TIMINGS.totals[stage]}")
+            lines.append(f"bot_stage_duration_seconds_count{self._labels([('stage', stage)])} {TIMINGS.counts[stage]}")
+        return "\n".join(lines) + "\n"
+    
+    async def _handle(self, reader, writer):
+        """Responde a uma requisição HTTP: GET /metrics ou 404."""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)
+            # Descartando os cabeçalhos da requisição
+            while (await asyncio.wait_for(reader.readline(), self.READ_TIMEOUT)).strip():
+                pass
+            
+            parts = request_line.decode("latin-1").split()
+            method = parts[0] if parts else ""
+            if len(parts) >= 2 and method in ("GET", "HEAD") and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            
+            headers = (
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(headers.encode("latin-1") + (body if method != "HEAD" else b""))
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.warning(f"Erro ao responder requisição de métricas: {str(e)}")
+        finally:
+            writer.close()
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processa updates de usuários diferentes em paralelo e os de um mesmo usuário em ordem.
+    
+    Cada usuário tem seu próprio lock, adquirido antes do limite global: updates enfileirados
+    de um usuário não ocupam vagas do limite, e o estado por usuário (user_data, conversa,
+    memória e cache de respostas) nunca é alterado por dois updates ao mesmo tempo.
+    
+    O process_update da PTB é final e adquire o semáforo da classe base antes de chamar
+    do_process_update. Por isso a classe base recebe um limite que nunca é atingido e o
+    limite real é aplicado aqui, depois do lock do usuário.
+    """
+    
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates deve ser um inteiro positivo")
+        super().__init__(sys.maxsize)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._user_locks = {}  # usuário -> [lock, updates aguardando ou em processamento]
+        self.pending = 0  # updates aguardando o lock do usuário ou uma vaga do limite
+    
+    @staticmethod
+    def _user_key(update):
+        """Identifica o dono do update (usuário ou, na falta dele, o chat)."""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+    
+    async def _run(self, coroutine):
+        async with self._slots:
+            # Durante o processamento o update deixa de contar como pendente
+            self.pending -= 1
+            try:
+                await coroutine
+            finally:
+                self.pending += 1
+    
+    async def do_process_update(self, update, coroutine):
+        self.pending += 1
+        key = self._user_key(update)
+        try:
+            if key is None:
+                await self._run(coroutine)
+                return
+            
+            entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    await self._run(coroutine)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._user_locks[key]
+        finally:
+            self.pending -= 1
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
 
 class TelegramBot:
+    # O Telegram exibe o "digitando..." por até 5 segundos a cada envio da ação
+    TYPING_ACTION_INTERVAL = 4.0
+    
     def __init__(self):
         logger.info("Iniciando TelegramBot...")
         try:
             self.advisor = OpenAIAdvisor()
+            self.menu_answers = MenuAnswerPool(self.advisor)
+            self.metrics_server = MetricsServer(self, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
             self.app = None
+            self.background_tasks = []
             
             # Inicializando componentes de humanização
             self.personality_manager = PersonalityManager()
@@ -1467,17 +3963,42 @@ class TelegramBot:
             logger.error(f"Erro ao iniciar TelegramBot: {str(e)}")
             raise
 
+    async def _pause(self, seconds):
+        """Pausa de humanização (contabilizada no /stats)."""
+        with TIMINGS.span("pausas de digitação"):
+            await asyncio.sleep(seconds)
+    
+    async def _await_with_typing(self, chat, task, deadline):
+        """Aguarda a tarefa mantendo o indicador de "digitando" ativo.
+        
+        Depois que a tarefa termina, dorme apenas o que faltar até `deadline` (o tempo "humano"
+        simulado), de modo que a espera total seja o maior entre o tempo real e o simulado.
+        """
+        loop = asyncio.get_running_loop()
+        last_action = None
+        while not task.done() or loop.time() < deadline:
+            if last_action is None or loop.time() - last_action >= self.TYPING_ACTION_INTERVAL:
+                await chat.send_action(action="typing")
+                last_action = loop.time()
+            next_action = last_action + self.TYPING_ACTION_INTERVAL
+            if task.done():
+                await self._pause(min(next_action, deadline) - loop.time())
+            else:
+                await asyncio.wait({task}, timeout=next_action - loop.time())
+        return task.result()
+    
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             user = update.effective_user
             logger.info(f"Novo usuário iniciou o bot: {user.id}")
+            METRICS.inc("bot_updates_total", type="start")
             
             # Verificando se é um usuário recorrente
-            user_info = self.advisor.storage.get_user_info(user.id)
+            user_info = await self.advisor.call_storage("get_user_info", user.id)
             is_returning_user = user_info.get("interaction_count", 0) > 0
             
             # Enviando "digitando..." com uma pausa natural
-            await asyncio.sleep(random.uniform(0.3, 0.7))
+            await self._pause(random.uniform(0.3, 0.7))
             await update.message.chat.send_action(action="typing")
             
             # Calculando um tempo de digitação realista para a mensagem de boas-vindas
@@ -1488,7 +4009,7 @@ class TelegramBot:
                 # Mensagem mais longa para novos usuários
                 typing_time = random.uniform(2.5, 3.5)
             
-            await asyncio.sleep(typing_time)
+            await self._pause(typing_time)
             
             # Preparando o teclado de opções
             keyboard = [
@@ -1562,7 +4083,7 @@ class TelegramBot:
                 )
             if not is_returning_user and random.random() < 0.7:
                 await update.message.chat.send_action(action="typing")
-                await asyncio.sleep(random.uniform(1.2, 2.0))
+                await self._pause(random.uniform(1.2, 2.0))
                 
                 follow_up_tips = (
                     "💡 Dica: Você pode me perguntar sobre praticamente qualquer assunto financeiro, como:\n\n"
@@ -1584,21 +4105,44 @@ class TelegramBot:
             )
             return ConversationHandler.END
 
+    @TIMINGS.timed("mensagem (total)")
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        generation_task = None
         try:
             user = update.effective_user
             message = update.message.text
             logger.info(f"Mensagem recebida do usuário {user.id}: {message}")
+            METRICS.inc("bot_updates_total", type="message")
 
             # Verificando se estamos aguardando uma consulta de pesquisa
             if context.user_data.get('awaiting_search_query'):
                 return await self.handle_web_search(update, context)
             
-            # Detectando a personalidade apropriada com base na mensagem
-            personality_type = self.personality_manager.select_appropriate_personality(message)
+            # Analisando a mensagem uma única vez (personalidade, sentimento, tópicos e complexidade)
+            analysis = self.advisor.analyze_message(message)
+            personality_type = analysis.personality_type
+            sentiment = analysis.sentiment
+            
+            # Complexidade da pergunta
+            question_complexity = analysis.question_complexity
+            
+            # Verificando se é uma solicitação de busca na web
+            search_web = analysis.keywords.any("search", "message")
+            
+            # Ajustando o contexto baseado na complexidade da pergunta
+            context_data = None
+            if question_complexity == "complexo":
+                context_data = "O usuário está solicitando uma explicação detalhada e abrangente. Forneça uma resposta completa com exemplos práticos quando possível."
             
-            # Detectando sentimento da mensagem
-            sentiment = self.text_analyzer.analyze_sentiment(message)
+            # A geração começa imediatamente e corre em paralelo com as pausas de humanização
+            if STREAM_RESPONSES:
+                generation_task, response_stream = self._start_stream(
+                    self.advisor.generate_response_stream(message, user.id, context_data=context_data, search_web=search_web, analysis=analysis)
+                )
+            else:
+                generation_task = asyncio.create_task(
+                    self.advisor.generate_response(message, user.id, context_data=context_data, search_web=search_web, analysis=analysis)
+                )
             
             # Calculando probabilidade de enviar reconhecimento com base no sentimento
             acknowledge_chance = self.variation_settings["acknowledge_message_chance"]
@@ -1620,10 +4164,10 @@ class TelegramBot:
                 await update.message.reply_text(random.choice(ack_options))
                 
                 # Adicionando uma pausa natural após o reconhecimento
-                await asyncio.sleep(random.uniform(0.5, 1.2))
+                await self._pause(random.uniform(0.5, 1.2))
             
             # Pausa breve e realista antes de mostrar o indicador de "digitando"
-            await asyncio.sleep(random.uniform(*self.variation_settings["typing_indicator_delay_range"]))
+            await self._pause(random.uniform(*self.variation_settings["typing_indicator_delay_range"]))
             
             # Enviando mensagem de "pensando" ocasionalmente (apenas 50% das vezes)
             thinking_message = None
@@ -1634,12 +4178,6 @@ class TelegramBot:
                 )
                 thinking_text = random.choice(thinking_messages) if thinking_messages else random.choice(self.typing_messages)
                 thinking_message = await update.message.reply_text(thinking_text)
-
-            # Enviando mensagem de "digitando..."
-            await update.message.chat.send_action(action="typing")
-            
-            # Analisando complexidade da pergunta
-            question_complexity = self.text_analyzer.detect_question_complexity(message)
             
             # Calculando tempo de digitação realista baseado na complexidade
             # 1. Primeiro, determinamos a "velocidade de digitação" desta personalidade
@@ -1670,46 +4208,39 @@ class TelegramBot:
             typing_time_seconds = min(max(typing_time_seconds * random.uniform(0.7, 1.1), 1.5), 6.0)
             
             # Ajustando para perguntas que precisam de "reflexão"
-            if "explique" in message.lower() or "detalhe" in message.lower() or "como" in message.lower():
+            if analysis.keywords.any("question", "reflection"):
                 typing_time_seconds += random.uniform(0.5, 1.5)  # Tempo adicional para "pensar"
             
-            # Aplicando o tempo de digitação calculado
-            await asyncio.sleep(typing_time_seconds)
-            
-            # Removendo a mensagem de "estou pensando" se existir
-            if thinking_message:
-                await thinking_message.delete()
-            
-            # Verificando se é uma solicitação de busca na web
-            search_keywords = ["atual", "hoje", "recente", "notícia", "mercado", "taxa", "cotação", "preço", 
-                             "inflação", "selic", "dólar", "euro", "bolsa", "tendência", "projeção", "previsão"]
-            
-            # Verificando se é uma solicitação de busca na web
-            search_web = any(keyword in message.lower() for keyword in search_keywords)
-            
-            # Ajustando o contexto baseado na complexidade da pergunta
-            context_data = None
-            if question_complexity == "complexo":
-                context_data = "O usuário está solicitando uma explicação detalhada e abrangente. Forneça uma resposta completa com exemplos práticos quando possível."
-            
-            # Gerando resposta
-            response = await self.advisor.generate_response(message, user.id, context_data=context_data, search_web=search_web)
-            
-            # Pequena pausa adicional para humanizar a resposta
-            await asyncio.sleep(random.uniform(*self.variation_settings["response_delay_range"]))
-            
-            # Dividindo respostas longas para não exceder limites do Telegram
-            if len(response) > 4096:
-                chunks = [response[i:i+4096] for i in range(0, len(response), 4096)]
-                for i, chunk in enumerate(chunks):
-                    await update.message.reply_text(chunk, parse_mode='Markdown')
-                    
-                    # Se não for o último chunk, simular digitação entre chunks
-                    if i < len(chunks) - 1:
-                        await asyncio.sleep(random.uniform(0.5, 1.2))  # Pausa natural entre chunks
-                        await update.message.chat.send_action(action="typing")
-                        await asyncio.sleep(random.uniform(0.8, 1.5))
+            if STREAM_RESPONSES:
+                # No modo streaming o texto já aparece enquanto é gerado
+                await update.message.chat.send_action(action="typing")
+                if thinking_message:
+                    await thinking_message.delete()
+                
+                # Exibindo a resposta progressivamente, a partir do que já foi gerado durante as pausas
+                response = await self._send_streamed_response(update.message, response_stream)
             else:
+                # Aguardando a geração com o "digitando" ativo; só o que faltar do tempo simulado
+                # de digitação (mais a pequena pausa final) é dormido
+                human_deadline = asyncio.get_running_loop().time() + typing_time_seconds + random.uniform(*self.variation_settings["response_delay_range"])
+                response = await self._await_with_typing(update.message.chat, generation_task, human_deadline)
+                
+                # Removendo a mensagem de "estou pensando" se existir
+                if thinking_message:
+                    await thinking_message.delete()
+                
+                # Dividindo respostas longas para não exceder limites do Telegram
+                if len(response) > TELEGRAM_MESSAGE_LIMIT:
+                    chunks = [response[i:i+TELEGRAM_MESSAGE_LIMIT] for i in range(0, len(response), TELEGRAM_MESSAGE_LIMIT)]
+                    for i, chunk in enumerate(chunks):
+                        await update.message.reply_text(chunk, parse_mode='Markdown')
+                        
+                        # Se não for o último chunk, simular digitação entre chunks
+                        if i < len(chunks) - 1:
+                            await self._pause(random.uniform(0.5, 1.2))  # Pausa natural entre chunks
+                            await update.message.chat.send_action(action="typing")
+                            await self._pause(random.uniform(0.8, 1.5))
+                else:
                     await update.message.reply_text(response, parse_mode='Markdown')
             
             # Adicionando follow-up ocasionalmente com probabilidade adaptativa
@@ -1725,16 +4256,16 @@ class TelegramBot:
                 follow_up_chance -= 0.15
             
             # Aumentando chance para tópicos que geralmente precisam de acompanhamento
-            topics = self.text_analyzer.extract_topics(message)
+            topics = analysis.topics
             if any(topic in ["investimentos", "planejamento", "aposentadoria"] for topic in topics):
                 follow_up_chance += 0.1
             
             # Aplicando a probabilidade de follow-up
             if random.random() < follow_up_chance:
                 # Pausa mais longa e natural antes do follow-up
-                await asyncio.sleep(random.uniform(1.0, 2.0))
+                await self._pause(random.uniform(1.0, 2.0))
                 await update.message.chat.send_action(action="typing")
-                await asyncio.sleep(random.uniform(0.5, 1.0))
+                await self._pause(random.uniform(0.5, 1.0))
                 
                 # Selecionando follow-up apropriado para a personalidade e complexidade
                 if question_complexity == "complexo":
@@ -1759,25 +4290,141 @@ class TelegramBot:
         except Exception as e:
             logger.error(f"Erro ao processar mensagem: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
+            if generation_task is not None and not generation_task.done():
+                generation_task.cancel()
             await update.message.reply_text(
                 "Ops! Tive um problema ao processar sua pergunta. Pode tentar novamente?"
             )
             return WAITING_RESPONSE
 
+    async def _send_or_edit(self, send, text, parse_mode=None):
+        """Envia ou edita uma mensagem tratando limites e erros comuns do Telegram."""
+        try:
+            return await send(text, parse_mode=parse_mode)
+        except telegram.error.RetryAfter as e:
+            # Limite de edições atingido: aguardando o tempo indicado pelo Telegram
+            await asyncio.sleep(e.retry_after)
+            return await send(text, parse_mode=parse_mode)
+        except telegram.error.BadRequest as e:
+            if "not modified" in str(e).lower():
+                return None
+            if parse_mode:
+                # Markdown inválido: enviando como texto simples
+                return await send(text)
+            raise
+    
+    async def _sync_streamed_messages(self, message, sent_messages, sent_texts, text, parse_mode=None):
+        """Sincroniza as mensagens já enviadas com o texto atual, em blocos de até 4096 caracteres."""
+        chunks = [text[i:i+TELEGRAM_MESSAGE_LIMIT] for i in range(0, len(text), TELEGRAM_MESSAGE_LIMIT)]
+        
+        for i, chunk in enumerate(chunks):
+            if i < len(sent_messages):
+                # Blocos completos não mudam durante o streaming
+                if sent_texts[i] == chunk and parse_mode is None:
+                    continue
+                edited = await self._send_or_edit(sent_messages[i].edit_text, chunk, parse_mode)
+                if isinstance(edited, telegram.Message):
+                    sent_messages[i] = edited
+                sent_texts[i] = chunk
+            else:
+                # Texto passou do limite do Telegram: iniciando uma nova mensagem
+                sent = await self._send_or_edit(message.reply_text, chunk, parse_mode)
+                sent_messages.append(sent)
+                sent_texts.append(chunk)
+        
+        # Removendo mensagens excedentes caso o texto final seja menor
+        while len(sent_messages) > max(len(chunks), 1):
+            sent_texts.pop()
+            await sent_messages.pop().delete()
+    
+    @staticmethod
+    def _start_stream(response_stream):
+        """Começa a consumir um stream de resposta em uma tarefa própria.
+        
+        Retorna a tarefa e um iterador com os itens recebidos; itens parciais acumulados
+        enquanto ninguém lia (durante as pausas de humanização) são resumidos ao mais recente.
+        """
+        updates = asyncio.Queue()
+        
+        async def pump():
+            try:
+                async for item in response_stream:
+                    updates.put_nowait(item)
+            finally:
+                updates.put_nowait(None)
+        
+        async def received():
+            finished = False
+            while not finished:
+                item = await updates.get()
+                if item is None:
+                    return
+                while not updates.empty():
+                    following = updates.get_nowait()
+                    if following is None:
+                        finished = True
+                        break
+                    item = following
+                yield item
+        
+        return asyncio.create_task(pump()), received()
+    
+    async def _send_streamed_response(self, message, response_stream):
+        """Exibe uma resposta em streaming editando a mensagem em intervalos controlados."""
+        loop = asyncio.get_running_loop()
+        sent_messages = []
+        sent_texts = []
+        last_edit = 0.0
+        final_text = ""
+        
+        async for text, final in response_stream:
+            if final:
+                final_text = text
+                break
+            
+            # Respeitando o intervalo mínimo entre edições (a primeira sai imediatamente)
+            if sent_messages and loop.time() - last_edit < STREAM_EDIT_INTERVAL:
+                continue
+            
+            await self._sync_streamed_messages(message, sent_messages, sent_texts, text)
+            last_edit = loop.time()
+        
+        # Versão final humanizada e formatada em Markdown
+        if final_text:
+            await self._sync_streamed_messages(message, sent_messages, sent_texts, final_text, parse_mode='Markdown')
+        
+        return final_text
+    
+    async def _menu_answer(self, topic, user_id):
+        """Resposta de um botão do menu: a compartilhada pré-gerada ou, sem ela, uma geração própria."""
+        response = await self.menu_answers.serve(topic, user_id)
+        if response is None:
+            # Gerando resposta com a personalidade adequada
+            response = await self.advisor.generate_response(
+                MenuAnswerPool.PROMPTS[topic], 
+                user_id, 
+                context_data=MenuAnswerPool.context_for(topic), 
+                search_web=topic in MenuAnswerPool.SEARCH_TOPICS
+            )
+        return response
+    
+    @TIMINGS.timed("botão do menu (total)")
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        answer_task = None
         try:
             query = update.callback_query
             user = query.from_user
             logger.info(f"Callback recebido do usuário {user.id}: {query.data}")
+            METRICS.inc("bot_updates_total", type="callback")
 
             await query.answer()
             
             # Tratamento especial para pesquisa na web
             if query.data == 'web_search':
                 # Pausa natural antes de responder
-                await asyncio.sleep(random.uniform(0.3, 0.7))
+                await self._pause(random.uniform(0.3, 0.7))
                 await query.message.chat.send_action(action="typing")
-                await asyncio.sleep(random.uniform(0.7, 1.2))
+                await self._pause(random.uniform(0.7, 1.2))
                 
                 web_search_prompts = [
                     "Sobre o que você quer pesquisar?",
@@ -1790,18 +4437,18 @@ class TelegramBot:
                 context.user_data['awaiting_search_query'] = True
                 return WAITING_RESPONSE
             
+            prompts = MenuAnswerPool.PROMPTS
+            
+            # A resposta é preparada em paralelo com as pausas de humanização
+            if query.data in prompts:
+                answer_task = asyncio.create_task(self._menu_answer(query.data, user.id))
+            
             # Enviando "digitando..." com uma pausa natural
-            await asyncio.sleep(random.uniform(0.2, 0.5))
+            await self._pause(random.uniform(0.2, 0.5))
             await query.message.chat.send_action(action="typing")
             
             # Selecionando uma personalidade apropriada para o tópico
-            personality_type = "default"
-            if query.data in ['variable_income', 'market_analysis', 'crypto']:
-                personality_type = "technical"  # Tópicos mais técnicos
-            elif query.data in ['planning', 'help']:
-                personality_type = "mentor"     # Tópicos de planejamento/educação
-            elif query.data in ['investments']:
-                personality_type = "friendly"   # Tópicos para iniciantes
+            personality_type = MenuAnswerPool.personality_for(query.data)
             
             # Obtendo a personalidade
             personality = self.personality_manager.get_personality(personality_type)
@@ -1829,43 +4476,19 @@ class TelegramBot:
                 # Tópicos simples
                 typing_time = random.uniform(1.2, 2.2)
             
-            await asyncio.sleep(typing_time)
+            # Aguardando a resposta com o "digitando" ativo; só o que faltar do tempo simulado é dormido
+            if answer_task is not None:
+                response = await self._await_with_typing(
+                    query.message.chat, answer_task, asyncio.get_running_loop().time() + typing_time
+                )
+            else:
+                await self._pause(typing_time)
             
             # Removendo mensagem de "pensando" se existir
             if thinking_message:
                 await thinking_message.delete()
 
-            prompts = {
-                'investments': "Quais são as principais opções de investimento no Brasil hoje, considerando diferentes perfis de risco e objetivos financeiros? O que você recomenda para quem está começando?",
-                'fixed_income': "Detalhe as melhores opções de renda fixa disponíveis no Brasil atualmente, com seus rendimentos aproximados, tributação, riscos e para qual perfil de investidor cada uma é mais adequada.",
-                'variable_income': "Quais são as melhores estratégias para investir em renda variável no Brasil atualmente? Fale sobre ações, FIIs, ETFs e BDRs, com dicas práticas para diferentes perfis de investidor.",
-                'funds': "Explique os principais tipos de fundos de investimento disponíveis no Brasil, suas características, vantagens e desvantagens. Como escolher o fundo mais adequado para cada objetivo?",
-                'crypto': "Qual a melhor forma de investir em criptomoedas com segurança no Brasil? Quais são as principais criptomoedas, exchanges confiáveis e estratégias recomendadas para diferentes perfis?",
-                'planning': "Como elaborar um planejamento financeiro completo e eficiente? Quais são as etapas essenciais, desde o orçamento pessoal até a aposentadoria?",
-                'market_analysis': "Como está o cenário macroeconômico e o mercado financeiro brasileiro atualmente? Quais são as perspectivas para os próximos meses e como isso afeta as decisões de investimento?",
-                'news': "Quais são as principais notícias econômicas e financeiras recentes que podem impactar os investimentos no Brasil? Como os investidores devem se posicionar diante desses acontecimentos?",
-                'help': "De que maneiras você pode me ajudar com planejamento financeiro, investimentos e educação financeira? Quais são seus diferenciais como consultor?"
-            }
-
             if query.data in prompts:
-                # Para análise de mercado e notícias, sempre pesquisar na web
-                search_web = query.data in ['market_analysis', 'news']
-                
-                # Para tópicos específicos, solicitar respostas mais detalhadas
-                detailed_topics = ['variable_income', 'funds', 'crypto', 'planning']
-                context_data = None
-                
-                if query.data in detailed_topics:
-                    context_data = "Este é um tópico complexo que exige uma explicação detalhada. Forneça uma resposta abrangente com pontos específicos e exemplos práticos."
-                
-                # Gerando resposta com a personalidade adequada
-                response = await self.advisor.generate_response(
-                    prompts[query.data], 
-                    user.id, 
-                    context_data=context_data, 
-                    search_web=search_web
-                )
-                
                 # Se a resposta for muito longa, dividir
                 if len(response) > 4096:
                     chunks = [response[i:i+4096] for i in range(0, len(response), 4096)]
@@ -1873,17 +4496,17 @@ class TelegramBot:
                         await query.message.reply_text(chunk, parse_mode='Markdown')
                         # Se não for o último chunk, simular digitação entre chunks
                         if i < len(chunks) - 1:
-                            await asyncio.sleep(random.uniform(0.5, 0.8))
+                            await self._pause(random.uniform(0.5, 0.8))
                             await query.message.chat.send_action(action="typing")
-                            await asyncio.sleep(random.uniform(0.8, 1.2))
+                            await self._pause(random.uniform(0.8, 1.2))
                 else:
                     await query.message.reply_text(response, parse_mode='Markdown')
                 
                 # Adicionando follow-up ocasionalmente
                 if random.random() < 0.25:  # 25% de chance
-                    await asyncio.sleep(random.uniform(1.0, 1.5))
+                    await self._pause(random.uniform(1.0, 1.5))
                     await query.message.chat.send_action(action="typing")
-                    await asyncio.sleep(random.uniform(0.5, 0.8))
+                    await self._pause(random.uniform(0.5, 0.8))
                     
                     follow_up_options = self.follow_up_variations.get(
                         personality_type, self.follow_up_variations["default"]
@@ -1900,11 +4523,14 @@ class TelegramBot:
         except Exception as e:
             logger.error(f"Erro no callback: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
+            if answer_task is not None and not answer_task.done():
+                answer_task.cancel()
             await query.message.reply_text(
                 "Ops! Tive um problema ao processar sua solicitação. Pode tentar novamente?"
             )
             return WAITING_RESPONSE
     
+    @TIMINGS.timed("pesquisa manual (total)")
     async def handle_web_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Trata consultas específicas de pesquisa na web."""
         user = update.effective_user
@@ -1921,37 +4547,39 @@ class TelegramBot:
                 "Coletando informações recentes..."
             ]
             
+            loop = asyncio.get_running_loop()
+            
             # Enviando mensagem de "pesquisando" após uma pequena pausa
-            await asyncio.sleep(random.uniform(0.3, 0.7))
+            await self._pause(random.uniform(0.3, 0.7))
             search_message = await update.message.reply_text(random.choice(searching_messages))
             
-            # Enviando mensagem de "digitando..."
-            await update.message.chat.send_action(action="typing")
-            
-            # Realizando a pesquisa
+            # Realizando a pesquisa com o "digitando" ativo; o tempo simulado de pesquisa
+            # só é dormido se a pesquisa real terminar antes dele
             search_query = f"finanças {query} brasil atual"
-            results = await GoogleSearch.search_google(search_query)
-            
-            # Simulando o tempo de pesquisa
-            await asyncio.sleep(random.uniform(1.5, 3.0))
+            results = await self._await_with_typing(
+                update.message.chat,
+                asyncio.create_task(GoogleSearch.search_google(search_query)),
+                loop.time() + random.uniform(1.5, 3.0)
+            )
             
             # Removendo a mensagem de "pesquisando"
             await search_message.delete()
             
-            # Enviando "digitando..." novamente para indicar que estamos processando os resultados
-            await update.message.chat.send_action(action="typing")
-            await asyncio.sleep(random.uniform(1.0, 2.0))
-            
             if results:
                 # Gerando resposta com base nos resultados da pesquisa
                 context_data = GoogleSearch.format_search_results(results)
                 
-                # Usando uma personalidade mais técnica para respostas baseadas em pesquisas
-                response = await self.advisor.generate_response(
-                    f"Com base nas informações recentes sobre '{query}'", 
-                    user.id, 
-                    context_data=context_data,
-                    search_web=False  # Já fizemos a pesquisa manualmente
+                # Usando uma personalidade mais técnica para respostas baseadas em pesquisas,
+                # com o tempo simulado de "processar os resultados" correndo junto com a geração
+                response = await self._await_with_typing(
+                    update.message.chat,
+                    asyncio.create_task(self.advisor.generate_response(
+                        f"Com base nas informações recentes sobre '{query}'", 
+                        user.id, 
+                        context_data=context_data,
+                        search_web=False  # Já fizemos a pesquisa manualmente
+                    )),
+                    loop.time() + random.uniform(1.0, 2.0)
                 )
                 
                 # Dividindo respostas longas
@@ -1961,9 +4589,9 @@ class TelegramBot:
                         await update.message.reply_text(chunk, parse_mode='Markdown')
                         # Se não for o último chunk, simular digitação entre chunks
                         if i < len(chunks) - 1:
-                            await asyncio.sleep(random.uniform(0.5, 0.8))
+                            await self._pause(random.uniform(0.5, 0.8))
                             await update.message.chat.send_action(action="typing")
-                            await asyncio.sleep(random.uniform(0.8, 1.2))
+                            await self._pause(random.uniform(0.8, 1.2))
                 else:
                     await update.message.reply_text(response, parse_mode='Markdown')
                 
@@ -1976,12 +4604,16 @@ class TelegramBot:
                         "Há algo específico desses dados que você gostaria de entender melhor?"
                     ]
                     
-                    await asyncio.sleep(random.uniform(1.0, 1.5))
+                    await self._pause(random.uniform(1.0, 1.5))
                     await update.message.chat.send_action(action="typing")
-                    await asyncio.sleep(random.uniform(0.5, 0.8))
+                    await self._pause(random.uniform(0.5, 0.8))
                     
                     await update.message.reply_text(random.choice(utility_questions))
             else:
+                # Enviando "digitando..." novamente antes de avisar que não houve resultados
+                await update.message.chat.send_action(action="typing")
+                await self._pause(random.uniform(1.0, 2.0))
+                
                 no_results_responses = [
                     "Não encontrei informações específicas sobre isso. Pode tentar reformular sua pergunta?",
                     "Parece que não consegui encontrar dados confiáveis sobre esse tema. Poderia detalhar melhor o que está procurando?",
@@ -1996,15 +4628,45 @@ class TelegramBot:
             
         return WAITING_RESPONSE
 
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Mostra aos administradores o tempo gasto por etapa e o uso dos caches."""
+        user = update.effective_user
+        if user.id not in ADMIN_USER_IDS:
+            logger.warning(f"Comando /stats negado para o usuário {user.id}")
+            return
+        
+        response_cache = self.advisor.cache_stats()
+        search_cache = GoogleSearch.cache_stats()
+        text = (
+            "Tempo por etapa (amostras recentes):\n"
+            f"{TIMINGS.report()}\n\n"
+            f"Cache de respostas: {response_cache['entries']} entradas, "
+            f"taxa de acerto {response_cache['hit_rate']:.0%} ({response_cache['hits']}/{response_cache['hits'] + response_cache['misses']})\n"
+            f"Cache de pesquisas: {search_cache['entries']} entradas, "
+            f"taxa de acerto {search_cache['hit_rate']:.0%} ({search_cache['hits']}/{search_cache['hits'] + search_cache['misses']})"
+        )
+        for i in range(0, len(text), TELEGRAM_MESSAGE_LIMIT):
+            await update.message.reply_text(text[i:i+TELEGRAM_MESSAGE_LIMIT])
+    
     def run(self):
         try:
             logger.info("Iniciando aplicação do bot...")
-            self.app = Application.builder().token(TOKEN).build()
+            with COMPONENTS.step("Aplicação do Telegram"):
+                self.app = (
+                    Application.builder()
+                    .token(TOKEN)
+                    .request(TimedHTTPXRequest(connection_pool_size=256))  # mesmo pool padrão da Application
+                    .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+                    .post_init(self.on_startup)
+                    .post_shutdown(self.on_shutdown)
+                    .build()
+                )
             
             # Resetando webhook para evitar conflitos
             logger.info("Removendo webhooks anteriores...")
             import requests
-            requests.get(f"https://api.telegram.org/bot{TOKEN}/deleteWebhook?drop_pending_updates=true")
+            with COMPONENTS.step("Remoção do webhook"):
+                requests.get(f"https://api.telegram.org/bot{TOKEN}/deleteWebhook?drop_pending_updates=true")
             
             # Importando asyncio aqui para evitar problemas de importação circular
             import asyncio
@@ -2028,6 +4690,7 @@ class TelegramBot:
             
             # Adicionando handlers
             self.app.add_handler(conv_handler)
+            self.app.add_handler(CommandHandler("stats", self.stats))
             
             # Adicionando um handler para tratar erros
             self.app.add_error_handler(self.error_handler)
@@ -2040,6 +4703,29 @@ class TelegramBot:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
+    async def on_startup(self, application):
+        """Inicia as tarefas em segundo plano da aplicação."""
+        logger.info(COMPONENTS.report())
+        await self.advisor.connect_storage()
+        if getattr(self.advisor.storage, 'write_behind', False):
+            # Tarefa fora do controle da Application para não atrasar o encerramento
+            self.background_tasks.append(asyncio.create_task(self.advisor.storage.run_write_behind()))
+        if MENU_ANSWERS_PREWARM:
+            self.background_tasks.append(asyncio.create_task(self.menu_answers.run()))
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+            self.background_tasks.append(asyncio.create_task(self.metrics_server.monitor_loop_lag()))
+    
+    async def on_shutdown(self, application):
+        """Libera recursos compartilhados ao encerrar a aplicação."""
+        for task in self.background_tasks:
+            task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        await GoogleSearch.close()
+        if hasattr(self.advisor.storage, 'close'):
+            await self.advisor.call_storage("close")
+    
     # Adicionando um handler de erro
     async def error_handler(self, update, context):
         """Trata erros ocorridos durante o processamento de updates."""
@@ -2056,6 +4742,10 @@ class TelegramBot:
             )
 
 if __name__ == "__main__":
+    if "--preflight" in sys.argv[1:]:
+        # Empacota os modelos de NLP para uso offline e encerra
+        sys.exit(0 if MODEL_BUNDLE.build() else 1)
+    
     try:
         # Verificar se o bot já está em execução
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -2072,46 +4762,14 @@ if __name__ == "__main__":
         if not OPENAI_API_KEY:
             raise ValueError("API Key da OpenAI não encontrada no arquivo .env!")
         
-        # Inicializando modelos de NLP necessários
-        def init_models():
-            """Inicializa e baixa os modelos necessários para NLP"""
-            try:
-                logger.info("Verificando e baixando recursos NLTK necessários...")
-                try:
-                    nltk.data.find('vader_lexicon')
-                    logger.info("Recursos NLTK já estão disponíveis")
-                except LookupError:
-                    logger.info("Baixando vader_lexicon para análise de sentimento...")
-                    nltk.download('vader_lexicon', quiet=True)
-                
-                logger.info("Verificando modelo spaCy...")
-                try:
-                    if not spacy.util.is_package("pt_core_news_sm"):
-                        logger.info("Modelo spaCy em português não encontrado. Tentando baixar...")
-                        os.system("python -m spacy download pt_core_news_sm")
-                    else:
-                        logger.info("Modelo spaCy em português já está disponível")
-                except Exception as e:
-                    logger.warning(f"Não foi possível verificar ou baixar o modelo spaCy: {str(e)}")
-                    logger.info("Tentando usar modelo em inglês como fallback")
-                    try:
-                        if not spacy.util.is_package("en_core_web_sm"):
-                            logger.info("Modelo spaCy em inglês não encontrado. Tentando baixar...")
-                            os.system("python -m spacy download en_core_web_sm")
-                    except Exception as e:
-                        logger.error(f"Não foi possível baixar nenhum modelo spaCy: {str(e)}")
-                        logger.warning("Algumas funcionalidades de NLP estarão limitadas")
-                
-                logger.info("Inicialização de modelos NLP concluída")
-            except Exception as e:
-                logger.error(f"Erro ao inicializar modelos NLP: {str(e)}")
-                logger.warning("O bot funcionará com capacidades de NLP limitadas")
-        
-        # Inicializando modelos NLP
-        init_models()
+        # Apenas verifica o manifesto dos modelos empacotados; nada é baixado na inicialização
+        with COMPONENTS.step("Verificação do manifesto de modelos"):
+            MODEL_BUNDLE.check()
         
+        # Modelos de NLP e dependências pesadas são carregados sob demanda (ComponentLoader)
         logger.info("Iniciando bot...")
-        bot = TelegramBot()
+        with COMPONENTS.step("TelegramBot (consultor, armazenamento e caches)"):
+            bot = TelegramBot()
         bot.run()
         
     except Exception as e:
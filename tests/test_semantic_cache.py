@@ -0,0 +1,103 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("LOG_FILE", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import OpenAIAdvisor, SemanticCache, TTLCache  # noqa: E402
+
+SCOPE = ("1", "default", "")
+
+DIFFERENT_QUESTIONS = [
+    ("quanto rende 1000 reais no cdb", "quanto rende 5000 reais no cdb"),
+    ("devo investir em ações agora", "não devo investir em ações agora"),
+    ("imposto de renda 2023", "imposto de renda 2024"),
+    ("quanto rende a poupança em 1 ano", "quanto rende a poupança em 10 anos"),
+    ("vale a pena um cdb que paga 100% do cdi", "vale a pena um cdb que paga 110% do cdi"),
+    ("como investir sem risco", "como investir com risco"),
+]
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS)
+def test_numbers_and_negations_do_not_match(cached, asked):
+    cache = SemanticCache(threshold=0.6)
+    cache.add(SCOPE, ("1", cached), cached)
+    assert cache.find(SCOPE, asked) is None
+
+
+def test_equivalent_question_matches():
+    cache = SemanticCache(threshold=0.6)
+    key = ("1", "quanto rende 1000 reais no cdb")
+    cache.add(SCOPE, key, key[1])
+    assert cache.find(SCOPE, "quanto rende no cdb 1000 reais?") == key
+
+
+NEAR_THRESHOLD_BASES = [
+    "como montar uma reserva de emergencia",
+    "como organizar as financas da familia",
+    "como sair das dividas rapidamente",
+    "o que significa diversificar a carteira",
+    "como comecar a investir com pouco dinheiro",
+    "qual a melhor forma de guardar dinheiro todo mes",
+    "vale a pena pagar a divida do cartao primeiro",
+    "qual a diferenca entre juros simples e compostos",
+    "como calcular quanto guardar para aposentadoria",
+    "qual o risco de investir na bolsa agora",
+]
+FILLER_WORDS = ["hoje", "ainda", "melhor", "rapido", "afinal", "mesmo", "agora", "sempre", "facil", "seguro", "bem"]
+
+
+def _shingle_similarity(cache, first, second):
+    _, first_shingles, _ = cache._features(first)
+    _, second_shingles, _ = cache._features(second)
+    return len(first_shingles & second_shingles) / len(first_shingles | second_shingles)
+
+
+def test_pairs_at_threshold_boundary_are_found():
+    probe = SemanticCache(threshold=0.6)
+    pairs = []
+    for base in NEAR_THRESHOLD_BASES:
+        words = base.split()
+        for i in range(len(words)):
+            for filler in FILLER_WORDS:
+                variant = " ".join(words[:i] + [filler] + words[i + 1:])
+                if 0.6 <= _shingle_similarity(probe, base, variant) < 0.7:
+                    pairs.append((base, variant))
+    assert len(pairs) >= 100
+
+    found = 0
+    for base, variant in pairs:
+        cache = SemanticCache(threshold=0.6)
+        cache.add(SCOPE, ("1", base), base)
+        found += cache.find(SCOPE, variant) == ("1", base)
+    assert found / len(pairs) >= 0.95
+
+
+def _advisor():
+    advisor = OpenAIAdvisor.__new__(OpenAIAdvisor)
+    advisor.response_cache = TTLCache(max_entries=10, default_ttl=60)
+    advisor.semantic_cache = SemanticCache(threshold=0.6)
+    return advisor
+
+
+@pytest.mark.parametrize("asked, hits, misses", [
+    ("quanto rende 1000 reais no cdb", 1, 0),
+    ("quanto rende no cdb 1000 reais?", 1, 0),
+    ("quanto rende 5000 reais no cdb", 0, 1),
+])
+def test_each_lookup_is_recorded_once(asked, hits, misses):
+    advisor = _advisor()
+    question = "quanto rende 1000 reais no cdb"
+    key = advisor._cache_key(1, question)
+    advisor.response_cache.set(key, "resposta")
+    advisor.semantic_cache.add(advisor._cache_scope(1, "default"), key, question)
+
+    analysis = SimpleNamespace(personality_type="default")
+    found = advisor._find_cached_response(1, asked, analysis=analysis)
+
+    assert (found == "resposta") == bool(hits)
+    stats = advisor.response_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (hits, misses)